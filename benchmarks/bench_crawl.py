@@ -0,0 +1,168 @@
+"""
+Compare the breadth first crawler (ldtpd/crawler.py) with the
+recursive per node crawl it replaced, on a synthetic 10k node window,
+alone and with the indexed appmap built from it.
+
+Usage: python benchmarks/bench_crawl.py [nodes] [latency in ms]
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+
+from synthetic import build_window, round_trips
+import pyatspi
+from utils import Utils
+from appmap import AppmapStore
+from registry import AppTable
+from constants import window_roles
+from crawler import Crawler
+
+class BenchUtils(Utils):
+    """
+    Utils without a desktop connection
+    """
+    def __init__(self):
+        self._appmap = AppmapStore()
+        self._appmap_changes = OrderedDict()
+        self._partial_crawls = {}
+        self._window_events = OrderedDict()
+        self._window_event_timer = None
+        self._desktop = []
+        self.app_table = AppTable()
+        self._handle_table_cell = False
+        self._ldtp_debug = None
+        self._ldtp_debug_file = None
+
+class RecursiveCrawl(BenchUtils):
+    """
+    The per node crawl used before ldtpd/crawler.py, kept here as the
+    baseline: it queries every node with _ldtpize_accessible and then
+    again for role, role name, name, application and index in parent
+    """
+    def crawl(self, gui, parent):
+        self.ldtpized_list = {}
+        self.ldtpized_obj_index = {}
+        self._recurse(gui, parent, gui.getIndexInParent())
+        return self.ldtpized_list
+
+    def _recurse(self, obj, parent, child_index):
+        index = -1
+        if child_index != -1:
+            parent = self._add(obj, parent, child_index)
+        for child in obj:
+            index += 1
+            if not child:
+                continue
+            try:
+                if child.getRole() == pyatspi.ROLE_TABLE_CELL:
+                    break
+            except:
+                continue
+            self._recurse(child, parent, index)
+
+    def _add(self, obj, parent, child_index):
+        abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(obj)
+        if abbrev_role in self.ldtpized_obj_index:
+            self.ldtpized_obj_index[abbrev_role] += 1
+        else:
+            self.ldtpized_obj_index[abbrev_role] = 0
+        if abbrev_name == '':
+            base = abbrev_role
+            name = '%s%d' % (base, self.ldtpized_obj_index[abbrev_role])
+        else:
+            base = name = '%s%s' % (abbrev_role, abbrev_name)
+        i = 0
+        while name in self.ldtpized_list:
+            i += 1
+            name = '%s%d' % (base, i)
+        if parent in self.ldtpized_list:
+            children = self.ldtpized_list[parent]['children']
+            if children:
+                children = '%s %s' % (children, name)
+            else:
+                children = name
+            self.ldtpized_list[parent]['children'] = children
+        key_binding = ''
+        try:
+            iaction = obj.queryAction()
+            for j in xrange(iaction.nActions):
+                if iaction.getKeyBinding(j) != '':
+                    key_binding = iaction.getKeyBinding(j)
+                    break
+        except NotImplementedError:
+            pass
+        if obj.getRole() in window_roles:
+            obj_index = '%s#%d' % (obj.getApplication().name,
+                                   obj.getIndexInParent())
+        else:
+            obj_index = '%s#%d' % (abbrev_role,
+                                   self.ldtpized_obj_index[abbrev_role])
+        self.ldtpized_list[name] = {'key' : name,
+                                    'parent' : parent,
+                                    'class' : obj.getRoleName().replace(' ', '_'),
+                                    'child_index' : child_index,
+                                    'children' : '',
+                                    'obj_index' : obj_index,
+                                    'label' : obj.name,
+                                    'label_by' : label_by or '',
+                                    'description' : obj.description,
+                                    'key_binding' : key_binding}
+        return name
+
+def measure(crawl, latency):
+    round_trips.reset(latency)
+    start = time.time()
+    appmap = crawl()
+    return appmap, round_trips.count, time.time() - start
+
+def main():
+    nodes = 10000
+    latency = 0.0
+    if len(sys.argv) > 1:
+        nodes = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        latency = float(sys.argv[2]) / 1000.0
+    app, window = build_window(nodes)
+    recursive = RecursiveCrawl()
+    utils = BenchUtils()
+    old, old_trips, old_time = measure(
+        lambda: recursive.crawl(window, app._name), latency)
+    # Crawl alone, without building the indexed appmap
+    tree, crawl_trips, crawl_time = measure(
+        lambda: Crawler(utils).fetch(window), latency)
+    new, new_trips, new_time = measure(
+        lambda: utils._appmap_pairs(window, 'dlgSyntheticWindow', True),
+        latency)
+    if sorted(old.keys()) != sorted(new.keys()):
+        print('FAIL: LDTP names differ between the crawls')
+        return 1
+    for name in old:
+        if dict(old[name]) != dict(new[name]):
+            print('FAIL: entry %s differs between the crawls' % name)
+            return 1
+    print('%d objects, simulated latency %.3f ms per round trip' % \
+              (len(new), latency * 1000))
+    print('%-14s %12s %10s' % ('crawl', 'round trips', 'seconds'))
+    print('%-14s %12d %10.3f' % ('recursive', old_trips, old_time))
+    print('%-14s %12d %10.3f' % ('breadth first', crawl_trips, crawl_time))
+    print('%-14s %12d %10.3f' % ('+ appmap', new_trips, new_time))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
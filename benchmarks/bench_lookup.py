@@ -0,0 +1,80 @@
+"""
+First lookup of one object in a window which isn't mapped yet: full
+window map followed by the lookup, compared with the lazy crawl which
+stops as soon as the object is found.
+
+Usage: python benchmarks/bench_lookup.py [nodes] [latency in ms]
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import sys
+import time
+
+from synthetic import build_window, round_trips
+from bench_crawl import BenchUtils
+
+WINDOW = 'dlgSyntheticWindow'
+
+def full_lookup(window, obj_name, obj_type):
+    utils = BenchUtils()
+    appmap = utils._appmap_pairs(window, WINDOW, True)
+    entry = utils._get_object_in_window(appmap, obj_name, obj_type)
+    return appmap.accessible(entry['key'])
+
+def lazy_lookup(window, obj_name, obj_type):
+    utils = BenchUtils()
+    return utils._internal_get_object(window, WINDOW, obj_name, obj_type)
+
+def measure(lookup, window, obj_name, obj_type, latency):
+    round_trips.reset(latency)
+    start = time.time()
+    acc = lookup(window, obj_name, obj_type)
+    return acc, round_trips.count, time.time() - start
+
+def main():
+    nodes = 10000
+    latency = 0.0
+    if len(sys.argv) > 1:
+        nodes = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        latency = float(sys.argv[2]) / 1000.0
+    app, window = build_window(nodes)
+    panels = len(window)
+    # Objects at the start, a quarter, middle and end of the window
+    lookups = [('btnApply00', []),
+               ('txtField%d10' % (panels // 4), ['text', 'entry']),
+               ('chkEnable%d20' % (panels // 2), ['check_box']),
+               ('btnApply%d45' % (panels - 1), ['push_button'])]
+    print('%d objects, simulated latency %.3f ms per round trip' % \
+              (nodes, latency * 1000))
+    print('%-22s %12s %12s %10s %10s' % ('object', 'full trips',
+                                          'lazy trips', 'full s', 'lazy s'))
+    for obj_name, obj_type in lookups:
+        full, full_trips, full_time = measure(full_lookup, window,
+                                              obj_name, obj_type, latency)
+        lazy, lazy_trips, lazy_time = measure(lazy_lookup, window,
+                                              obj_name, obj_type, latency)
+        if full is None or full is not lazy:
+            print('FAIL: %s resolved to different objects' % obj_name)
+            return 1
+        print('%-22s %12d %12d %10.3f %10.3f' % (obj_name, full_trips,
+                                                  lazy_trips, full_time,
+                                                  lazy_time))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Map the windows of a synthetic application one at a time, and
+concurrently on crawl pools of increasing size, with simulated IPC
+latency. The appmaps must be the same in all the runs.
+
+Usage: python benchmarks/bench_parallel.py [windows] [nodes] [latency in ms]
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import sys
+import time
+
+from synthetic import build_app, round_trips
+from bench_crawl import BenchUtils
+from crawler import CrawlPool
+
+def snapshot(utils, names):
+    appmaps = []
+    for name in names:
+        appmap = utils._appmap[name]
+        appmaps.append(dict((key, dict(appmap[key])) for key in appmap))
+    return appmaps
+
+def map_windows(windows, names, size, latency):
+    utils = BenchUtils()
+    utils.crawl_pool = CrawlPool(size)
+    round_trips.reset(latency)
+    start = time.time()
+    utils._remap_windows(list(zip(windows, names)))
+    elapsed = time.time() - start
+    return snapshot(utils, names), round_trips.count, elapsed
+
+def map_window(window, name, size, latency):
+    utils = BenchUtils()
+    utils.crawl_pool = CrawlPool(size)
+    round_trips.reset(latency)
+    start = time.time()
+    utils._appmap_pairs(window, name, True)
+    elapsed = time.time() - start
+    return snapshot(utils, [name]), round_trips.count, elapsed
+
+def main():
+    count = 4
+    nodes = 1000
+    latency = 0.1 / 1000.0
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        nodes = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        latency = float(sys.argv[3]) / 1000.0
+    app, windows = build_app(count, nodes)
+    names = ['dlgSyntheticWindow%d' % i for i in range(count)]
+    print('%d windows of %d objects, simulated latency %.3f ms per ' \
+              'round trip' % (count, nodes, latency * 1000))
+    print('%-24s %8s %12s %10s' % ('crawl', 'threads', 'round trips',
+                                   'seconds'))
+    for label, crawl, args in (
+        ('windows', map_windows, (windows, names)),
+        ('subtrees of one window', map_window, (windows[0], names[0]))):
+        expected = None
+        for size in (1, 2, 4, 8):
+            appmaps, trips, elapsed = crawl(*(args + (size, latency)))
+            if expected is None:
+                expected = appmaps
+            elif appmaps != expected:
+                print('FAIL: %s crawl with %d threads differs' % \
+                          (label, size))
+                return 1
+            print('%-24s %8d %12d %10.3f' % (label, size, trips, elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
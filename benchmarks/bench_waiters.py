@@ -0,0 +1,111 @@
+"""
+Waiter construction followed by one poll, as guiexist / objectexist /
+hasstate do: waiters building a Utils of their own (state tables,
+desktop lookup, empty appmap), compared with waiters bound to the
+daemon instance.
+
+Usage: python benchmarks/bench_waiters.py [waits] [nodes] [latency in ms]
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import sys
+import time
+
+from synthetic import build_window, round_trips
+from bench_crawl import BenchUtils
+from utils import Utils
+from registry import WindowRegistry
+from waiters import GuiExistsWaiter, ObjectExistsWaiter, StateWaiter, \
+    NullWaiter
+
+WINDOW = 'dlgSyntheticWindow'
+
+class DesktopUtils(BenchUtils):
+    """
+    BenchUtils on the synthetic desktop, with the state tables
+    """
+    def __init__(self, app):
+        BenchUtils.__init__(self)
+        self._states = {}
+        self._states_old = {}
+        self._state_names = {}
+        self._old_state_names = {}
+        self._get_all_state_names()
+        self._desktop = [app]
+        self.app_table.add(app)
+
+def own_utils(app, daemon):
+    # Every waiter was a Utils, built for the wait
+    return DesktopUtils(app)
+
+def daemon_utils(app, daemon):
+    return daemon
+
+WAITS = [('null', lambda utils: NullWaiter(utils, 1, 0)),
+         ('window', lambda utils: GuiExistsWaiter(utils, WINDOW, 0)),
+         ('object', lambda utils: ObjectExistsWaiter(utils, WINDOW,
+                                                     'btnApply345', 0)),
+         ('state', lambda utils: StateWaiter(utils, WINDOW, 'chkEnable520',
+                                             0, 'enabled'))]
+
+def measure(bind, build, app, daemon, waits, latency):
+    round_trips.reset(latency)
+    start = time.time()
+    for i in range(waits):
+        waiter = build(bind(app, daemon))
+        waiter.check()
+        if not waiter.success and not isinstance(waiter, NullWaiter):
+            return None, 0, 0
+    return True, round_trips.count, time.time() - start
+
+def main():
+    waits = 100
+    nodes = 1000
+    latency = 0.0
+    if len(sys.argv) > 1:
+        waits = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        nodes = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        latency = float(sys.argv[3]) / 1000.0
+    app, window = build_window(nodes)
+    Utils.window_registry = WindowRegistry()
+    daemon = DesktopUtils(app)
+    print('%d waits, %d objects, simulated latency %.3f ms per round ' \
+              'trip' % (waits, nodes, latency * 1000))
+    print('%-8s %12s %12s %10s %10s' % ('wait', 'own trips',
+                                        'daemon trips', 'own ms',
+                                        'daemon ms'))
+    for label, build in WAITS:
+        # Warm up the daemon, as a running daemon would be
+        measure(daemon_utils, build, app, daemon, 1, 0.0)
+        own, own_trips, own_time = measure(own_utils, build, app, daemon,
+                                           waits, latency)
+        shared, shared_trips, shared_time = measure(daemon_utils, build,
+                                                    app, daemon, waits,
+                                                    latency)
+        if not own or not shared:
+            print('FAIL: %s wait not met' % label)
+            return 1
+        print('%-8s %12d %12d %10.3f %10.3f' % (label, own_trips,
+                                                 shared_trips,
+                                                 own_time * 1000 / waits,
+                                                 shared_time * 1000 / waits))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Synthetic accessible trees for the LDTP daemon benchmarks.
+
+Every call which would be a D-Bus round trip with at-spi2 is counted,
+and optionally delayed to simulate the IPC latency.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import sys
+import time
+import threading
+
+# Benchmarks import the daemon modules the way they import each other
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'ldtpd'))
+
+import pyatspi
+from memo import property_memo
+
+class RoundTrips(object):
+    """
+    Round trip counter shared by all the synthetic accessibles
+    """
+    def __init__(self):
+        self.count = 0
+        self.latency = 0.0
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self.count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset(self, latency=None):
+        # Each measurement is served as a request of its own
+        property_memo.end_request()
+        property_memo.begin_request()
+        self.count = 0
+        if latency is not None:
+            self.latency = latency
+
+round_trips = RoundTrips()
+
+class Relation(object):
+    def __init__(self, relation_type, target):
+        self._type = relation_type
+        self._target = target
+
+    def getRelationType(self):
+        return self._type
+
+    def getTarget(self, i):
+        round_trips.call()
+        return self._target
+
+class Action(object):
+    def __init__(self, key_binding):
+        self.nActions = 1
+        self._key_binding = key_binding
+
+    def getKeyBinding(self, i):
+        round_trips.call()
+        return self._key_binding
+
+class StateSet(object):
+    def __init__(self, states):
+        self._states = states
+
+    def getStates(self):
+        return list(self._states)
+
+    def contains(self, state):
+        return state in self._states
+
+class Accessible(object):
+    """
+    Minimal pyatspi Accessible, every remote call is counted
+    """
+    def __init__(self, name, role, role_name, children=(),
+                 description='', key_binding=None):
+        self._name = name
+        self._role = role
+        self._role_name = role_name
+        self._description = description
+        self._key_binding = key_binding
+        self._label = None
+        self._parent = None
+        self._children = []
+        self.states = [pyatspi.STATE_ENABLED, pyatspi.STATE_SHOWING]
+        for child in children:
+            self.append(child)
+
+    def append(self, child):
+        child._parent = self
+        self._children.append(child)
+
+    def label_by(self, label):
+        self._label = label
+
+    @property
+    def name(self):
+        round_trips.call()
+        return self._name
+
+    @property
+    def description(self):
+        round_trips.call()
+        return self._description
+
+    @property
+    def parent(self):
+        round_trips.call()
+        return self._parent
+
+    @property
+    def childCount(self):
+        round_trips.call()
+        return len(self._children)
+
+    def getRole(self):
+        round_trips.call()
+        return self._role
+
+    def getRoleName(self):
+        round_trips.call()
+        return self._role_name
+
+    def getRelationSet(self):
+        round_trips.call()
+        if self._label:
+            return [Relation(pyatspi.RELATION_LABELLED_BY, self._label)]
+        return []
+
+    def queryAction(self):
+        round_trips.call()
+        if self._key_binding is None:
+            raise NotImplementedError
+        return Action(self._key_binding)
+
+    def getState(self):
+        round_trips.call()
+        return StateSet(self.states)
+
+    def getIndexInParent(self):
+        round_trips.call()
+        if not self._parent:
+            return -1
+        return self._parent._children.index(self)
+
+    def getApplication(self):
+        round_trips.call()
+        acc = self
+        while acc._parent:
+            acc = acc._parent
+        return acc
+
+    def getChildAtIndex(self, index):
+        round_trips.call()
+        if 0 <= index < len(self._children):
+            return self._children[index]
+        return None
+
+    def __iter__(self):
+        # pyatspi iterates with childCount + getChildAtIndex
+        for index in range(self.childCount):
+            yield self.getChildAtIndex(index)
+
+    def __len__(self):
+        return len(self._children)
+
+    def __nonzero__(self):
+        return True
+    __bool__ = __nonzero__
+
+def _add_panels(window, nodes):
+    leaves_per_panel = 50
+    panel_count = 0
+    count = 1
+    while count < nodes:
+        panel = Accessible('', pyatspi.ROLE_PANEL, 'panel')
+        window.append(panel)
+        count += 1
+        for i in range(0, leaves_per_panel, 5):
+            label = Accessible('Field %d.%d:' % (panel_count, i),
+                               pyatspi.ROLE_LABEL, 'label')
+            entry = Accessible('', pyatspi.ROLE_TEXT, 'text')
+            entry.label_by(label)
+            panel.append(label)
+            panel.append(entry)
+            panel.append(Accessible('Apply %d.%d' % (panel_count, i),
+                                    pyatspi.ROLE_PUSH_BUTTON, 'push button',
+                                    key_binding='<Alt>a'))
+            panel.append(Accessible('Enable %d.%d' % (panel_count, i),
+                                    pyatspi.ROLE_CHECK_BOX, 'check box',
+                                    key_binding=''))
+            panel.append(Accessible('', pyatspi.ROLE_FILLER, 'filler'))
+            count += 5
+        panel_count += 1
+
+def build_window(nodes=10000, title='Synthetic Window', app_name='synthetic'):
+    """
+    Build an application with one dialog of about the given number of
+    nodes: panels of labelled entries, buttons, check boxes and
+    unnamed fillers
+
+    @return: application, window
+    @rtype: tuple
+    """
+    app = Accessible(app_name, pyatspi.ROLE_APPLICATION, 'application')
+    window = Accessible(title, pyatspi.ROLE_DIALOG, 'dialog')
+    app.append(window)
+    _add_panels(window, nodes)
+    return app, window
+
+def build_app(windows=4, nodes=1000, app_name='synthetic'):
+    """
+    Build an application with the given number of dialogs, of about
+    the given number of nodes each
+
+    @return: application, windows
+    @rtype: tuple
+    """
+    app = Accessible(app_name, pyatspi.ROLE_APPLICATION, 'application')
+    dialogs = []
+    for i in range(windows):
+        window = Accessible('Synthetic Window %d' % i, pyatspi.ROLE_DIALOG,
+                            'dialog')
+        app.append(window)
+        _add_panels(window, nodes)
+        dialogs.append(window)
+    return app, dialogs
@@ -0,0 +1,630 @@
+"""
+LDTP v2 appmap.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+from collections import OrderedDict
+from matcher import pattern_cache, strip_for_class, WINDOW_STRIP, \
+    OBJECT_STRIP
+
+# Entry fields with an exact match index, in the order
+# Utils._match_name_to_appmap tries them
+INDEXED_FIELDS = ('obj_index', 'label_by', 'label')
+
+# Entry fields, in the order they were stored in the old dict entries
+ENTRY_FIELDS = ('key', 'parent', 'class', 'child_index', 'children',
+                'obj_index', 'label', 'label_by', 'description',
+                'key_binding')
+
+# Estimated bytes held per entry: the entry, its index slots and the
+# bound accessible proxy, besides the strings. Measured on the synthetic
+# benchmark window, at-spi proxies are bigger, so this is a low estimate
+ENTRY_BYTES = 1800
+
+# Removed entries leave a slot in the entry list, the list is compacted
+# once there are more of them than this, and than live entries
+COMPACT_THRESHOLD = 256
+
+_interned = {}
+
+def intern_string(string):
+    """
+    Share one copy of frequently repeated strings (role names, labels,
+    key bindings) between all the cached entries. Builtin intern
+    doesn't accept unicode
+    """
+    if not string:
+        return string
+    return _interned.setdefault(string, string)
+
+class AppmapEntry(object):
+    """
+    Appmap entry of one object.
+
+    Behaves like the read only dict used earlier ('key', 'class',
+    'children', ...), so getobjectinfo / getobjectproperty output is
+    unchanged, but keeps the children as a list of entry ids of the
+    owning Appmap instead of a space separated string
+    """
+    __slots__ = ('key', 'parent', 'class_name', 'child_index', 'children',
+                 'obj_index', 'label', 'label_by', 'description',
+                 'key_binding', 'id', 'appmap')
+
+    def __init__(self, key, parent, class_name, child_index, obj_index,
+                 label, label_by, description, key_binding):
+        self.key = key
+        self.parent = parent
+        self.class_name = intern_string(class_name)
+        self.child_index = child_index
+        self.children = []
+        self.obj_index = obj_index
+        self.label = label
+        self.label_by = intern_string(label_by)
+        self.description = description
+        self.key_binding = intern_string(key_binding)
+        # Assigned by the owning Appmap
+        self.id = None
+        self.appmap = None
+
+    def children_names(self):
+        """
+        Get LDTP names of the children
+        """
+        entries = self.appmap._entries
+        return [entries[i].key for i in self.children
+                if entries[i] is not None]
+
+    def __getitem__(self, field):
+        if field == 'class':
+            return self.class_name
+        if field == 'children':
+            return ' '.join(self.children_names())
+        if field not in ENTRY_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+        return field in ENTRY_FIELDS
+
+    def keys(self):
+        return list(ENTRY_FIELDS)
+
+    def items(self):
+        return [(field, self[field]) for field in ENTRY_FIELDS]
+
+    def __iter__(self):
+        return iter(ENTRY_FIELDS)
+
+    def __len__(self):
+        return len(ENTRY_FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class Appmap(dict):
+    """
+    Application map of a window, LDTP object name -> appmap entry.
+
+    Besides the object name, the entries are indexed on obj_index,
+    label, label_by and the stripped label / label_by / key, so that
+    a locator without wildcards is resolved with dict lookups instead
+    of a glob match against every entry.
+
+    The accessible of every entry is bound while crawling, so that
+    AT-SPI events can be mapped back to the entry they modify
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        # Per role counter of unnamed objects, kept to name the
+        # objects added by incremental updates
+        self.obj_index = {}
+        # Window accessible the appmap was crawled from
+        self.window = None
+        # Loaded from a snapshot, objects resolved by walking the index
+        # path are not known to match the entries yet
+        self.from_snapshot = False
+        # Parent name -> per role counter of its children, for the
+        # stable object names, see Utils._stable_object_name
+        self.sibling_index = {}
+        self._accessibles = {}
+        self._names = {}
+        # Entry id -> entry, None for removed entries
+        self._entries = []
+        self._removed = 0
+        # Estimated bytes, see estimate_size
+        self._size = 0
+        self._index = {}
+        for field in INDEXED_FIELDS:
+            self._index[field] = {}
+        # (strip regex pattern, stripped value) -> names
+        self._index['stripped'] = {}
+        self.update(*args, **kwargs)
+
+    def _index_keys(self, name, entry):
+        strip = strip_for_class(entry.class_name)
+        keys = []
+        for field in INDEXED_FIELDS:
+            value = getattr(entry, field)
+            if value:
+                keys.append((field, value))
+        for value in (entry.label_by, entry.label):
+            if value:
+                # Labels are mostly unique, not worth the pattern cache
+                keys.append(('stripped', (strip.pattern,
+                                          strip.sub('', value))))
+        keys.append(('stripped', (strip.pattern, name)))
+        return keys
+
+    def _add_index(self, name, entry):
+        for field, value in self._index_keys(name, entry):
+            names = self._index[field].setdefault(value, [])
+            if name not in names:
+                names.append(name)
+
+    def _remove_index(self, name, entry):
+        for field, value in self._index_keys(name, entry):
+            names = self._index[field].get(value)
+            if not names:
+                continue
+            if name in names:
+                names.remove(name)
+            if not names:
+                del self._index[field][value]
+
+    def __setitem__(self, name, entry):
+        if name in self:
+            old = dict.__getitem__(self, name)
+            self._remove_index(name, old)
+            # Take over the id, so that the parent still refers to it
+            entry.id = old.id
+            entry.children = old.children
+        else:
+            entry.id = len(self._entries)
+            self._entries.append(None)
+        entry.appmap = self
+        self._entries[entry.id] = entry
+        dict.__setitem__(self, name, entry)
+        self._add_index(name, entry)
+        self._size += self._entry_size(entry)
+
+    def _forget(self, name):
+        entry = dict.__getitem__(self, name)
+        self.sibling_index.pop(name, None)
+        self._remove_index(name, entry)
+        self._entries[entry.id] = None
+        self._size -= self._entry_size(entry)
+        self.unbind(name)
+        self._removed += 1
+        if self._removed > COMPACT_THRESHOLD and \
+                self._removed > len(self._entries) - self._removed:
+            self.compact()
+
+    def compact(self):
+        """
+        Drop the slots of the removed entries from the entry list,
+        renumbering the entries in the same order
+        """
+        ids = {}
+        entries = []
+        for entry in self._entries:
+            if entry is not None:
+                ids[entry.id] = len(entries)
+                entries.append(entry)
+        for entry in entries:
+            entry.children = [ids[i] for i in entry.children if i in ids]
+            entry.id = ids[entry.id]
+        self._entries = entries
+        self._removed = 0
+
+    def __delitem__(self, name):
+        self._forget(name)
+        dict.__delitem__(self, name)
+
+    def pop(self, name, *default):
+        if name in self:
+            self._forget(name)
+        return dict.pop(self, name, *default)
+
+    def clear(self):
+        dict.clear(self)
+        self._accessibles.clear()
+        self._names.clear()
+        del self._entries[:]
+        self._removed = 0
+        self._size = 0
+        self.sibling_index.clear()
+        for field in self._index:
+            self._index[field].clear()
+
+    def update(self, *args, **kwargs):
+        for name, entry in dict(*args, **kwargs).items():
+            self[name] = entry
+
+    def bind(self, name, acc):
+        """
+        Remember the accessible handle of the given entry
+        """
+        self._accessibles[name] = acc
+        try:
+            self._names[acc] = name
+        except TypeError:
+            # Unhashable accessible, can't be reverse mapped
+            pass
+
+    def unbind(self, name):
+        acc = self._accessibles.pop(name, None)
+        if acc is None:
+            return
+        try:
+            if self._names.get(acc) == name:
+                del self._names[acc]
+        except TypeError:
+            pass
+
+    def accessible(self, name):
+        """
+        Get the accessible handle bound to the given entry, or None
+        """
+        return self._accessibles.get(name)
+
+    def name_of(self, acc):
+        """
+        Get the LDTP name of the given accessible, or None
+        """
+        try:
+            return self._names.get(acc)
+        except TypeError:
+            return None
+
+    def _entry_size(self, entry):
+        size = ENTRY_BYTES
+        for value in (entry.key, entry.obj_index, entry.label,
+                      entry.description):
+            if value:
+                size += len(value)
+        return size
+
+    def estimate_size(self):
+        """
+        Get estimated memory held by the appmap, kept current as the
+        entries are added / removed
+
+        @return: bytes
+        @rtype: integer
+        """
+        return self._size
+
+    def root(self):
+        """
+        Get LDTP name of the window entry, the first one added, or None
+        """
+        for entry in self._entries:
+            if entry is not None:
+                return entry.key
+        return None
+
+    def add_child(self, parent, name):
+        """
+        Append the entry as the last child of the parent entry
+        """
+        if parent in self and name in self:
+            dict.__getitem__(self, parent).children.append(
+                dict.__getitem__(self, name).id)
+
+    def children_of(self, name):
+        """
+        Get LDTP names of the direct children of the given entry
+        """
+        entry = self.get(name)
+        if not entry:
+            return []
+        return entry.children_names()
+
+    def remove_subtree(self, name, keep_root=True):
+        """
+        Remove all the descendants of the given entry
+
+        @param name: LDTP name of the subtree root
+        @type name: string
+        @param keep_root: Remove just the descendants, not the root
+        @type keep_root: boolean
+
+        @return: Number of entries removed
+        @rtype: integer
+        """
+        removed = 0
+        stack = self.children_of(name)
+        while stack:
+            child = stack.pop()
+            if child not in self:
+                continue
+            stack.extend(self.children_of(child))
+            del self[child]
+            removed += 1
+        if keep_root:
+            # Children are added again, counted from the start
+            self.sibling_index.pop(name, None)
+            if name in self:
+                self[name].children = []
+        elif name in self:
+            del self[name]
+            removed += 1
+        return removed
+
+    def _first(self, names, obj_type):
+        for name in names:
+            entry = dict.__getitem__(self, name)
+            if not obj_type or entry.class_name in obj_type:
+                return entry
+        return None
+
+    def lookup(self, obj_name, obj_type=[]):
+        """
+        Exact match lookup of a locator without glob characters
+
+        @param obj_name: Object name, LDTP name, label or obj_index
+        @type obj_name: string
+        @param obj_type: Restrict to these appmap classes, [] for any
+        @type obj_type: list
+
+        @return: appmap entry on success, else None
+        @rtype: dict
+        """
+        if not obj_name:
+            return None
+        if obj_name in self:
+            entry = self._first([obj_name], obj_type)
+            if entry:
+                return entry
+        for field in INDEXED_FIELDS:
+            entry = self._first(self._index[field].get(obj_name, []),
+                                obj_type)
+            if entry:
+                return entry
+        for strip in (OBJECT_STRIP, WINDOW_STRIP):
+            stripped = pattern_cache.strip(obj_name, strip)
+            entry = self._first(self._index['stripped'].get(
+                    (strip.pattern, stripped), []), obj_type)
+            if entry:
+                return entry
+        return None
+
+    def lookup_all(self, obj_name, obj_type=[]):
+        """
+        Exact match lookup of a locator without glob characters, all the
+        matching entries
+
+        @param obj_name: Object name, LDTP name, label or obj_index
+        @type obj_name: string
+        @param obj_type: Restrict to these appmap classes, [] for any
+        @type obj_type: list
+
+        @return: appmap entries, in crawl order
+        @rtype: list
+        """
+        if not obj_name:
+            return []
+        names = set()
+        if obj_name in self:
+            names.add(obj_name)
+        for field in INDEXED_FIELDS:
+            names.update(self._index[field].get(obj_name, []))
+        for strip in (OBJECT_STRIP, WINDOW_STRIP):
+            stripped = pattern_cache.strip(obj_name, strip)
+            names.update(self._index['stripped'].get(
+                    (strip.pattern, stripped), []))
+        entries = [dict.__getitem__(self, name) for name in names]
+        entries.sort(key=lambda entry: entry.id)
+        return [entry for entry in entries
+                if not obj_type or entry.class_name in obj_type]
+
+class AppmapStore(dict):
+    """
+    Cached appmaps, LDTP window name -> Appmap.
+
+    Keeps a reverse index from the window accessible to the names its
+    appmap is cached under, so that a window event finds / evicts the
+    cache of exactly that window.
+
+    Windows which are never destroyed, or whose destroy event was
+    missed, would stay cached forever. With a budget, the least recently
+    used appmaps are dropped once the total entries / estimated bytes
+    exceed it, the window is crawled again on next access
+    """
+    def __init__(self, max_entries=0, max_bytes=0):
+        dict.__init__(self)
+        self._windows = {}
+        # Budget, 0 for no limit
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Name -> (entries, estimated bytes) when cached, least
+        # recently used first
+        self._usage = OrderedDict()
+        self.entries = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.budget_evictions = 0
+        self.stale_recoveries = 0
+
+    def _window_key(self, window):
+        if window is None:
+            return None
+        try:
+            hash(window)
+        except TypeError:
+            # Unhashable accessible, can't be reverse mapped
+            return None
+        return window
+
+    def _unindex(self, name):
+        entries, size = self._usage.pop(name, (0, 0))
+        self.entries -= entries
+        self.bytes -= size
+        key = self._window_key(dict.__getitem__(self, name).window)
+        names = self._windows.get(key)
+        if names is None:
+            return
+        names.discard(name)
+        if not names:
+            del self._windows[key]
+
+    def __setitem__(self, name, appmap):
+        if name in self:
+            self._unindex(name)
+        dict.__setitem__(self, name, appmap)
+        key = self._window_key(appmap.window)
+        if key is not None:
+            self._windows.setdefault(key, set()).add(name)
+        self._account(name, appmap)
+        self._enforce_budget(name)
+
+    def _account(self, name, appmap):
+        entries, size = self._usage.pop(name, (0, 0))
+        self.entries -= entries
+        self.bytes -= size
+        entries = len(appmap)
+        size = appmap.estimate_size()
+        # Most recently used
+        self._usage[name] = (entries, size)
+        self.entries += entries
+        self.bytes += size
+
+    def remeasure(self, appmap):
+        """
+        Account the appmap again after it was patched in place, dropping
+        least recently used appmaps if it grew beyond the budget
+
+        @param appmap: Cached appmap
+        @type appmap: object
+        """
+        names = self._windows.get(self._window_key(appmap.window))
+        if names is None:
+            # Unhashable window accessible
+            names = self.keys()
+        names = [name for name in names
+                 if dict.__getitem__(self, name) is appmap]
+        for name in names:
+            self._account(name, appmap)
+        for name in names:
+            if name in self:
+                self._enforce_budget(name)
+
+    def _over_budget(self):
+        return (self.max_entries and self.entries > self.max_entries) or \
+            (self.max_bytes and self.bytes > self.max_bytes)
+
+    def _enforce_budget(self, keep):
+        """
+        Drop least recently used appmaps till the store fits the budget,
+        the given one is kept even if it alone exceeds the budget
+        """
+        while self._over_budget() and len(self._usage) > 1:
+            name = next(iter(self._usage))
+            if name == keep:
+                self._usage[name] = self._usage.pop(name)
+                continue
+            del self[name]
+            self.budget_evictions += 1
+
+    def _touch(self, name):
+        if name in self._usage:
+            self._usage[name] = self._usage.pop(name)
+
+    def __delitem__(self, name):
+        self._unindex(name)
+        dict.__delitem__(self, name)
+
+    def pop(self, name, *default):
+        if name in self:
+            self._unindex(name)
+        return dict.pop(self, name, *default)
+
+    def clear(self):
+        dict.clear(self)
+        self._windows.clear()
+        self._usage.clear()
+        self.entries = self.bytes = 0
+
+    def find(self, window, name=None):
+        """
+        Get the appmap cached for the given window accessible
+
+        @param window: Window handle
+        @type window: object
+        @param name: Preferred LDTP window name, if cached under many
+        @type name: string
+
+        @return: appmap, None if the window isn't cached
+        @rtype: object
+        """
+        names = self._windows.get(self._window_key(window))
+        if not names:
+            if name in self and dict.__getitem__(self, name).window == window:
+                # Accessible proxies which don't hash consistently
+                return self._hit(name)
+            self.misses += 1
+            return None
+        if name in names:
+            return self._hit(name)
+        return self._hit(sorted(names)[0])
+
+    def _hit(self, name):
+        self.hits += 1
+        self._touch(name)
+        return dict.__getitem__(self, name)
+
+    def evict(self, window):
+        """
+        Drop the appmaps cached for the given window accessible
+
+        @return: Number of appmaps evicted
+        @rtype: integer
+        """
+        names = self._windows.get(self._window_key(window), ())
+        count = len(names)
+        for name in list(names):
+            del self[name]
+        self.evictions += count
+        return count
+
+    def stats(self):
+        """
+        Get usage and hit / eviction counters
+
+        @return: dictionary of counter name and value
+        @rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {'windows' : len(self),
+                'entries' : self.entries,
+                'bytes' : self.bytes,
+                'max_entries' : self.max_entries,
+                'max_bytes' : self.max_bytes,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : float(self.hits) / lookups if lookups else 0.0,
+                'evictions' : self.evictions,
+                'budget_evictions' : self.budget_evictions,
+                'stale_recoveries' : self.stale_recoveries}
@@ -75,3 +75,13 @@ abbreviated_roles = {
     pyatspi.ROLE_OPTION_PANE : 'opane',
     pyatspi.ROLE_POPUP_MENU : 'popmnu',
     pyatspi.ROLE_EMBEDDED : 'emb'}
+
+# Roles treated as window, their title is stripped of just
+# space and new line
+window_roles = (pyatspi.ROLE_FRAME,
+                pyatspi.ROLE_DIALOG,
+                pyatspi.ROLE_WINDOW,
+                pyatspi.ROLE_FONT_CHOOSER,
+                pyatspi.ROLE_FILE_CHOOSER,
+                pyatspi.ROLE_ALERT,
+                pyatspi.ROLE_COLOR_CHOOSER)
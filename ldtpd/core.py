@@ -41,12 +41,16 @@ except:
     pass
   gtk3=False
 from utils import Utils, ProcessStats
+from memo import property_memo, negative_cache
+from matcher import pattern_cache
+from appmap import ENTRY_FIELDS
 from constants import abbreviated_roles
 from keypress_actions import KeyboardOp
 from waiters import ObjectExistsWaiter, GuiExistsWaiter, \
     GuiNotExistsWaiter, ObjectNotExistsWaiter, NullWaiter, \
     MaximizeWindow, MinimizeWindow, UnmaximizeWindow, UnminimizeWindow, \
-    ActivateWindow, CloseWindow
+    ActivateWindow, CloseWindow, MultiWaiter, StateWaiter, IdleWaiter, \
+    wait_engine, settle_stats
 from server_exception import LdtpServerException
 import os
 import re
@@ -176,7 +180,6 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         app_list=[]
         for app in self._list_apps():
             try:
-                app=app[0] # Just use the application handle
                 if app.name != '<unknown>':
                     app_list.append(app.name)
             except LookupError:
@@ -195,27 +198,7 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @return: list of window names in LDTP format of string type on success.
         @rtype: list
         """
-        window_list=[]
-        window_type={}
-        for gui in self._list_guis():
-            if not gui:
-                continue
-            window_name=self._ldtpize_accessible(gui)
-            if window_name[1] == '':
-                if window_name[0] in window_type:
-                    window_type[window_name[0]] += 1
-                else:
-                    window_type[window_name[0]]=0
-                tmp_name='%d' % window_type[window_name[0]]
-            else:
-                tmp_name=window_name[1]
-            w_name=window_name='%s%s' % (window_name[0], tmp_name)
-            index=1
-            while window_name in window_list:
-                window_name='%s%d' % (w_name, index)
-                index += 1
-            window_list.append(window_name)
-        return window_list
+        return self._list_window_names()
 
     def isalive(self):
         """
@@ -227,6 +210,34 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
 
         return True
 
+    def getcachestats(self):
+        """
+        Get hit / miss counters of the daemon caches
+
+        @return: dictionary of cache name and its counters
+        @rtype: dict
+        """
+        stats = {'pattern' : pattern_cache.stats(),
+                'handle' : dict(Utils.handle_cache_stats),
+                'lazy' : dict(Utils.lazy_crawl_stats),
+                'window_event' : dict(Utils.window_event_stats),
+                'window' : {'windows' : len(self.window_registry),
+                            'rescans' : self.window_registry.rescans},
+                'app' : {'apps' : len(self.app_table),
+                         'resyncs' : self.app_table.resyncs},
+                'appmap' : self._appmap.stats(),
+                'memo' : property_memo.stats(),
+                'negative' : negative_cache.stats(),
+                'wait' : dict(wait_engine.stats),
+                'settle' : settle_stats.stats(),
+                'object_handle' : {'handles' : len(self.object_handles),
+                                   'hits' : self.object_handles.hits,
+                                   'reresolves' :
+                                       self.object_handles.reresolves}}
+        if self.appmap_snapshots:
+            stats['snapshot'] = self.appmap_snapshots.stats()
+        return stats
+
     def handletablecell(self):
         self._handle_table_cell=True
         return 1
@@ -247,6 +258,23 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         self._delaycmdexec=delay
 
+    def pacecmdexec(self, quiet_ms=None):
+        """
+        Pace command execution adaptively, a command is executed as
+        soon as the application of its window was idle for quiet_ms,
+        waiting at most the command delay (delaycmdexec /
+        LDTP_COMMAND_DELAY, else 1 second)
+
+        @param quiet_ms: Quiet interval in milliseconds, None to delay
+        commands for the fixed command delay
+        @type quiet_ms: integer
+
+        @return: 1 on success
+        @rtype: integer
+        """
+        self._pacecmdexec=quiet_ms
+        return 1
+
     def launchapp(self, cmd, args=[], delay=0, env=1, lang="C"):
         """
         Launch application.
@@ -575,9 +603,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=MaximizeWindow(window_name)
+        waiter=MaximizeWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def minimizewindow(self, window_name=None):
         """
@@ -592,9 +620,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=MinimizeWindow(window_name)
+        waiter=MinimizeWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def unmaximizewindow(self, window_name=None):
         """
@@ -609,9 +637,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=UnmaximizeWindow(window_name)
+        waiter=UnmaximizeWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def unminimizewindow(self, window_name=None):
         """
@@ -626,9 +654,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=UnminimizeWindow(window_name)
+        waiter=UnminimizeWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def activatewindow(self, window_name):
         """
@@ -643,9 +671,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=ActivateWindow(window_name)
+        waiter=ActivateWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def closewindow(self, window_name=None):
         """
@@ -660,9 +688,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        waiter=CloseWindow(window_name)
+        waiter=CloseWindow(self, window_name)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def guiexist(self, window_name, object_name=''):
         """
@@ -678,12 +706,23 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @return: 1 if GUI was found, 0 if not.
         @rtype: integer
         """
+        # Probes for absent GUI are repeated in tight loops, answer
+        # them from the negative cache till the desktop changes
+        key = ('guiexist', window_name, object_name)
+        if negative_cache.hit(key):
+            return 0
         if object_name:
-            waiter=ObjectExistsWaiter(window_name, object_name, 0)
+            waiter=ObjectExistsWaiter(self, window_name, object_name, 0)
         else:
-            waiter=GuiExistsWaiter(window_name, 0)
+            waiter=GuiExistsWaiter(self, window_name, 0)
 
-        return int(waiter.run())
+        exists = int(waiter.check())
+        if not exists:
+            if object_name:
+                negative_cache.add(key, self._window_app(window_name))
+            else:
+                negative_cache.add(key)
+        return exists
 
     def guitimeout(self, timeout):
       """
@@ -731,11 +770,16 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @rtype: integer
         """
         if object_name:
-            waiter=ObjectExistsWaiter(window_name, object_name, guiTimeOut, state)
+            if state:
+                waiter=StateWaiter(self, window_name, object_name,
+                                   guiTimeOut, state)
+            else:
+                waiter=ObjectExistsWaiter(self, window_name, object_name,
+                                          guiTimeOut)
         else:
-            waiter=GuiExistsWaiter(window_name, guiTimeOut)
+            waiter=GuiExistsWaiter(self, window_name, guiTimeOut)
 
-        return int(waiter.run())
+        return waiter.run().addCallback(int)
 
     def waittillguinotexist(self, window_name, object_name='', guiTimeOut=30):
         """
@@ -755,11 +799,119 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if object_name:
             waiter=\
-                ObjectNotExistsWaiter(window_name, object_name, guiTimeOut)
+                ObjectNotExistsWaiter(self, window_name, object_name,
+                                      guiTimeOut)
         else:
-            waiter=GuiNotExistsWaiter(window_name, guiTimeOut)
+            waiter=GuiNotExistsWaiter(self, window_name, guiTimeOut)
+
+        return waiter.run().addCallback(int)
+
+    def _condition_waiter(self, condition, guiTimeOut):
+        """
+        Get waiter of a waittillany / waittillall condition
+
+        @param condition: type, one of guiexist, guinotexist and
+        hasstate, window_name, and optional object_name and state
+        @type condition: dict
+
+        @return: waiter
+        @rtype: object
+        """
+        try:
+            condition_type = condition.get('type', 'guiexist')
+            window_name = condition['window_name']
+        except (AttributeError, KeyError):
+            raise LdtpServerException('Invalid wait condition %s' % \
+                                          (condition,))
+        object_name = condition.get('object_name', '')
+        state = condition.get('state', '')
+        if condition_type == 'guiexist' or condition_type == 'hasstate':
+            if condition_type == 'hasstate' and \
+                    (not object_name or not state):
+                raise LdtpServerException(
+                    'hasstate condition requires object_name and state')
+            if object_name and state:
+                return StateWaiter(self, window_name, object_name,
+                                   guiTimeOut, state)
+            if object_name:
+                return ObjectExistsWaiter(self, window_name, object_name,
+                                          guiTimeOut)
+            return GuiExistsWaiter(self, window_name, guiTimeOut)
+        if condition_type == 'guinotexist':
+            if object_name:
+                return ObjectNotExistsWaiter(self, window_name, object_name,
+                                             guiTimeOut)
+            return GuiNotExistsWaiter(self, window_name, guiTimeOut)
+        raise LdtpServerException('Invalid wait condition type "%s"' % \
+                                      condition_type)
+
+    def _wait_conditions(self, conditions, guiTimeOut, wait_all):
+        if not isinstance(conditions, list) or not conditions:
+            raise LdtpServerException('Conditions must be a non empty list')
+        waiters = [self._condition_waiter(condition, guiTimeOut) \
+                       for condition in conditions]
+        return MultiWaiter(self, waiters, guiTimeOut, wait_all).run()
+
+    def waittillany(self, conditions, guiTimeOut=30):
+        """
+        Wait till any of the conditions is met, eg: the save dialog or
+        the error alert, whichever comes first.
+
+        @param conditions: Conditions, each a dictionary of type
+        (guiexist, guinotexist or hasstate, default guiexist),
+        window_name, and optional object_name and state, as
+        waittillguiexist / waittillguinotexist / hasstate take them
+        @type conditions: list
+        @param guiTimeOut: Wait timeout in seconds
+        @type guiTimeOut: integer
+
+        @return: result 1 if a condition was met, else 0, condition
+        index of the condition met (-1 on timeout), elapsed seconds
+        and met, [condition index, seconds] of the conditions met
+        @rtype: dict
+        """
+        return self._wait_conditions(conditions, guiTimeOut, False)
+
+    def waittillall(self, conditions, guiTimeOut=30):
+        """
+        Wait till all of the conditions were met.
+
+        @param conditions: Conditions, each a dictionary of type
+        (guiexist, guinotexist or hasstate, default guiexist),
+        window_name, and optional object_name and state, as
+        waittillguiexist / waittillguinotexist / hasstate take them
+        @type conditions: list
+        @param guiTimeOut: Wait timeout in seconds
+        @type guiTimeOut: integer
+
+        @return: result 1 if all conditions were met, else 0, condition
+        index of the condition met last (-1 on timeout), elapsed
+        seconds and met, [condition index, seconds] of the conditions
+        met, in the order they were met
+        @rtype: dict
+        """
+        return self._wait_conditions(conditions, guiTimeOut, True)
+
+    def waitforidle(self, window_name='', quiet_ms=250, guiTimeOut=30):
+        """
+        Wait till the application of the window is idle, no AT-SPI
+        event from it for the quiet interval. Settle times are
+        reported by getcachestats.
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob. Empty for all the
+        applications
+        @type window_name: string
+        @param quiet_ms: Quiet interval in milliseconds
+        @type quiet_ms: integer
+        @param guiTimeOut: Wait timeout in seconds
+        @type guiTimeOut: integer
 
-        return int(waiter.run())
+        @return: 1 if the application got idle, 0 if not.
+        @rtype: integer
+        """
+        waiter=IdleWaiter(self, window_name, quiet_ms, guiTimeOut)
+        return waiter.run()
 
     def getobjectsize(self, window_name, object_name):
         """
@@ -831,8 +983,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         try:
             waiter=\
-                ObjectExistsWaiter(window_name, object_name, guiTimeOut, state)
-            return int(waiter.run())
+                StateWaiter(self, window_name, object_name, guiTimeOut,
+                            state)
+            return waiter.run().addCallback(int)
         except:
           if self._ldtp_debug_file:
             with open(self._ldtp_debug_file, "a") as fp:
@@ -1166,14 +1319,7 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @return: list of properties
         @rtype: list
         """
-        _window_handle, _window_name=\
-            self._get_window_handle(window_name, True)
-        if not _window_handle:
-            raise LdtpServerException('Unable to find window "%s"' % \
-                                          window_name)
-        appmap=self._appmap_pairs(_window_handle, _window_name)
-
-        obj_info=self._get_object_in_window(appmap, object_name)
+        obj_info=self._get_object_entry(window_name, object_name)
         props=[]
         if obj_info:
             for obj_prop in obj_info.keys():
@@ -1197,18 +1343,91 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @return: property
         @rtype: string
         """
+        obj_info=self._get_object_entry(window_name, object_name)
+        if obj_info and prop in obj_info:
+            return obj_info[prop]
+        raise LdtpServerException('Unknown property "%s" in %s' % \
+                                      (prop, object_name))
+
+    def queryobjects(self, window_name, role='', name='', state=[],
+                     ancestor='', depth=-1, properties=[], regex=False):
+        """
+        Find all the objects in the window matching the given criteria,
+        in one call.
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param role: Role name or list of role names, eg: push_button,
+        or an empty string for any.
+        @type role: string or list
+        @param name: Object name, either full name, LDTP's name
+        convention, or a Unix glob, or a regular expression if regex is
+        set. Empty string for any.
+        @type name: string
+        @param state: State names all the objects must have, eg:
+        ['enabled', 'showing'].
+        @type state: list
+        @param ancestor: Restrict to the descendants of this object.
+        @type ancestor: string
+        @param depth: Levels below the ancestor / window, -1 for any.
+        @type depth: integer
+        @param properties: Object properties to return, eg: ['class',
+        'label', 'states'], empty list for just the object names.
+        @type properties: list
+        @param regex: name is a regular expression, searched in the
+        LDTP name, label and label_by.
+        @type regex: boolean
+
+        @return: list of matched object names, or with properties, list
+        of dictionaries of property name and value, 'key' being the
+        object name.
+        @rtype: list
+        """
+        if isinstance(role, list):
+            roles=[re.sub(' ', '_', r) for r in role]
+        elif role:
+            roles=[re.sub(' ', '_', role)]
+        else:
+            roles=[]
+        if not isinstance(state, list):
+            state=[state]
+        if not isinstance(properties, list):
+            properties=[properties]
+        for prop in properties:
+            if prop != 'states' and prop not in ENTRY_FIELDS:
+                raise LdtpServerException('Unknown property "%s"' % prop)
         _window_handle, _window_name=\
             self._get_window_handle(window_name, True)
         if not _window_handle:
             raise LdtpServerException('Unable to find window "%s"' % \
                                           window_name)
         appmap=self._appmap_pairs(_window_handle, _window_name)
-
-        obj_info=self._get_object_in_window(appmap, object_name)
-        if obj_info and prop in obj_info:
-            return obj_info[prop]
-        raise LdtpServerException('Unknown property "%s" in %s' % \
-                                      (prop, object_name))
+        entries=self._query_appmap(_window_handle, _window_name, appmap,
+                                   roles, name, regex, state, ancestor,
+                                   int(depth))
+        if not properties:
+            return [entry.key for entry in entries]
+        matches=[]
+        for entry in entries:
+            match={'key' : entry.key}
+            for prop in properties:
+                if prop == 'states':
+                    acc=self._get_entry_accessible(_window_handle,
+                                                   _window_name, appmap,
+                                                   entry)
+                    try:
+                        _obj_state=acc.getState().getStates()
+                        match[prop]=[self._state_names[obj_state] \
+                                         for obj_state in _obj_state]
+                    except:
+                        # In at-spi2 gi._glib.GError exception is thrown
+                        # for the objects which no longer exist
+                        match[prop]=[]
+                else:
+                    match[prop]=entry[prop]
+            matches.append(match)
+        return matches
 
     def getchild(self, window_name, child_name='', role='', parent=''):
         """
@@ -1239,23 +1458,27 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
                                               window_name)
             appmap=self._appmap_pairs(_window_handle, _window_name)
             obj=self._get_object_in_window(appmap, parent)
-            obj_name=appmap[obj['key']]
+            if not obj:
+                raise LdtpServerException(
+                    'Unable to find object name "%s" in application map' % \
+                        parent)
+            # Matched against every descendant, compile once
+            child_locator=pattern_cache.locator(child_name)
             def _get_all_children_under_obj(obj, child_list):
                 if role and obj['class'] == role:
                     child_list.append(obj['key'])
-                elif child_name and self._match_name_to_appmap(child_name, obj):
+                elif child_name and \
+                        self._match_name_to_appmap(child_locator, obj):
                     child_list.append(obj['key'])
-                if obj:
-                    children=obj['children']
-                if not children:
-                    return child_list
-                for child in children:
-                    return _get_all_children_under_obj( \
-                        appmap[child],
-                        child_list)
+                for child in appmap.children_of(obj['key']):
+                    _get_all_children_under_obj(appmap[child], child_list)
+                return child_list
 
             matches=_get_all_children_under_obj(obj, [])
             if not matches:
+                _name=''
+                _role=''
+                _parent=''
                 if child_name:
                     _name='name "%s" ' % child_name
                 if role:
@@ -1273,6 +1496,9 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
             raise LdtpServerException('Unable to find window "%s"' % \
                                           window_name)
         appmap=self._appmap_pairs(_window_handle, _window_name)
+        # Matched against every entry, compile once
+        child_locator=pattern_cache.locator(child_name)
+        parent_locator=pattern_cache.locator(parent)
         for name in appmap.keys():
             obj=appmap[name]
             # When only role arg is passed
@@ -1280,15 +1506,15 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
                 matches.append(name)
             # When parent and child_name arg is passed
             if parent and child_name and not role and \
-                    self._match_name_to_appmap(parent, obj):
+                    self._match_name_to_appmap(parent_locator, obj):
                 matches.append(name)
             # When only child_name arg is passed
             if child_name and not role and \
-                    self._match_name_to_appmap(child_name, obj):
+                    self._match_name_to_appmap(child_locator, obj):
                 matches.append(name)
             # When role and child_name args are passed
             if role and child_name and obj['class'] == role and \
-                    self._match_name_to_appmap(child_name, obj):
+                    self._match_name_to_appmap(child_locator, obj):
                 matches.append(name)
 
         if not matches:
@@ -1309,12 +1535,24 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
     def remap(self, window_name):
         """
         @param window_name: Window name to look for, either full name,
-        LDTP's name convention, or a Unix glob.
-        @type window_name: string
+        LDTP's name convention, or a Unix glob. List of window names
+        are mapped concurrently.
+        @type window_name: string or list
 
         @return: 1
         @rtype: integer
         """
+        if isinstance(window_name, list):
+            windows=[]
+            for name in window_name:
+                _window_handle, _window_name=\
+                    self._get_window_handle(name, True)
+                if not _window_handle:
+                    raise LdtpServerException('Unable to find window "%s"' % \
+                                                  name)
+                windows.append((_window_handle, _window_name))
+            self._remap_windows(windows)
+            return 1
         _window_handle, _window_name=\
             self._get_window_handle(window_name, True)
         if not _window_handle:
@@ -1323,6 +1561,44 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         self._appmap_pairs(_window_handle, _window_name, True)
         return 1
 
+    def getobjecthandle(self, window_name, object_name):
+        """
+        Get handle of the object, which can be passed in place of the
+        object name to the other methods. The object is resolved once,
+        and again only when it no longer exists.
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. Or menu heirarchy
+        @type object_name: string
+
+        @return: object handle on success.
+        @rtype: string
+        """
+        record = self.object_handles.add(window_name, object_name)
+        try:
+            self._get_handle_object(record.handle)
+        except:
+            self.object_handles.remove(record.handle)
+            raise
+        return record.handle
+
+    def releaseobjecthandle(self, handle):
+        """
+        Release handle of the object
+
+        @param handle: Object handle, from getobjecthandle
+        @type handle: string
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        if not self.object_handles.remove(handle):
+            raise LdtpServerException('Unknown object handle "%s"' % handle)
+        return 1
+
     def wait(self, timeout=5):
         """
         Wait a given amount of seconds.
@@ -1333,13 +1609,8 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         @return: 1
         @rtype: integer
         """
-        if timeout < 1:
-            # If timeout < 1, like 0.5 then use
-            # time.sleep, using > 1 its not recommended to use
-            # this, as it hangs the desktop for the sleep time
-            time.sleep(timeout)
-            return 1
-        waiter=NullWaiter(1, timeout)
+        # Served by the wait engine, the daemon isn't blocked meanwhile
+        waiter=NullWaiter(self, 1, timeout)
         return waiter.run()
 
     def getstatusbartext(self, window_name, object_name):
@@ -1444,7 +1715,12 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
         """
         if not wnckModule:
           raise LdtpServerException('Install python wnck module')
-        self.wait(wait_time)
+        if wait_time:
+            return self.wait(wait_time).addCallback(
+                lambda _: self._get_object_name_at_coords())
+        return self._get_object_name_at_coords()
+
+    def _get_object_name_at_coords(self):
         # Following lines from Accerciser, _inspectUnderMouse method
         # quick_select.py file
         # Inspect accessible under mouse
@@ -1490,12 +1766,10 @@ class Ldtpd(Utils, ComboBox, Table, Menu, PageTabList,
             child_windows=[child_window.get_name() for child_window in \
                              w[1].get_application().get_windows()]
             for app in self._list_apps():
-                if not app[0]:
-                    continue
-                if stdout != app[0].name:
+                if stdout != app.name:
                     continue
-                # if stdout == app[0].name:
-                for gui in app[0]:
+                # if stdout == app.name:
+                for gui in app:
                     if not gui: continue
                     # If current a11y gui.name doesn't match the
                     # Wnck window names, let us assume, its the window
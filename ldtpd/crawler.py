@@ -0,0 +1,382 @@
+"""
+LDTP v2 crawler.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+import pyatspi
+from constants import abbreviated_roles, window_roles
+from matcher import WINDOW_STRIP, OBJECT_STRIP
+from appmap import intern_string
+from memo import property_memo
+
+class Node(object):
+    """
+    Prefetched accessible, everything the appmap needs from a node
+    """
+    __slots__ = ('acc', 'index', 'role', 'role_name', 'abbrev_role',
+                 'name', 'label', 'label_by', 'description',
+                 'key_binding', 'children')
+
+    def __init__(self, acc, index):
+        self.acc = acc
+        # Index in parent, as counted while iterating the parent
+        self.index = index
+        self.role = None
+        self.role_name = ''
+        self.abbrev_role = 'ukn'
+        self.name = ''
+        self.label = ''
+        self.label_by = ''
+        self.description = ''
+        self.key_binding = ''
+        self.children = []
+
+class CrawlPool(object):
+    """
+    Bounded pool of crawler threads. Crawling is waiting on D-Bus round
+    trips most of the time, so independent windows / subtrees are
+    fetched concurrently
+    """
+    def __init__(self, size=1):
+        """
+        @param size: Maximum number of threads, 1 crawls sequentially
+        @type size: integer
+        """
+        self.size = max(1, size)
+
+    def map(self, func, items):
+        """
+        Call func on every item, in at most size threads
+
+        @return: results in the order of the items
+        @rtype: list
+        """
+        items = list(items)
+        if self.size == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        results = [None] * len(items)
+        errors = [None] * len(items)
+        pending = Queue()
+        for i in range(len(items)):
+            pending.put(i)
+        def worker():
+            while True:
+                try:
+                    i = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[i] = func(items[i])
+                except Exception as e:
+                    errors[i] = e
+        threads = []
+        for i in range(min(self.size, len(items))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        for error in errors:
+            if error is not None:
+                # Same exception as the sequential crawl would raise
+                raise error
+        return results
+
+class Crawler(object):
+    """
+    Fetch the subtree of a window one level at a time: the children of
+    every node of the level are fetched, each child completely (role,
+    role name, name, label, description and key binding) while its
+    parent is iterated, then the next level. Utils._add_appmap_nodes
+    adds the fetched tree depth first, so the LDTP names are the same
+    as with the old recursive crawl.
+
+    Every D-Bus round trip for a node is done exactly once: the old
+    recursive crawl asked the same node for its role up to three times,
+    its name twice and its role name, application and index in parent
+    on every node. Role names are resolved once per role, the
+    application name once per crawl, and the iteration of the children
+    stops at the first table cell instead of fetching the roles of all
+    the cells. On the synthetic 10k node window
+    (benchmarks/bench_crawl.py) that is 76260 round trips instead of
+    116440, the order of the crawl has nothing to do with it
+    """
+    def __init__(self, utils):
+        """
+        @param utils: Utils instance, for label relation lookup and
+        table cell handling
+        @type utils: object
+        """
+        self._utils = utils
+        self._role_names = {}
+        self._app_name = None
+
+    def fetch(self, acc, index=-1, pool=None):
+        """
+        Fetch the given accessible and all its descendants
+
+        @param acc: Subtree root
+        @type acc: object
+        @param index: Index of acc in its parent
+        @type index: integer
+        @param pool: Fetch the subtrees of the children concurrently
+        @type pool: CrawlPool
+
+        @return: root of the prefetched tree
+        @rtype: Node
+        """
+        root = Node(acc, index)
+        self._fetch_role(root)
+        if root.role is None:
+            raise LookupError('Unable to fetch accessible')
+        self._fetch_label(root)
+        self._fetch_extra(root)
+        if pool and pool.size > 1:
+            self._fetch_levels([root], 1)
+            # Children are in order and every subtree is fetched as a
+            # whole, so the merged tree is the same as a sequential fetch
+            pool.map(self._fetch_subtree, root.children)
+        else:
+            self._fetch_levels([root])
+        return root
+
+    def _fetch_subtree(self, node):
+        crawler = Crawler(self._utils)
+        # Role names are shared, a dict store is atomic
+        crawler._role_names = self._role_names
+        crawler._fetch_levels([node])
+        return node
+
+    def _fetch_levels(self, level, depth=None):
+        """
+        Fetch the descendants of the nodes, breadth first, up to the
+        given depth, None for all
+        """
+        while level:
+            if depth is not None:
+                if depth == 0:
+                    break
+                depth -= 1
+            next_level = []
+            for node in level:
+                node.children = self._fetch_child_nodes(node)
+                next_level.extend(node.children)
+            level = next_level
+
+    def _fetch_child_nodes(self, node, details=True):
+        """
+        Fetch the children of the node, each with everything the appmap
+        needs, in one pass
+
+        @param details: Fetch the labels, description and key bindings
+        too, else just the roles
+        @type details: boolean
+        """
+        children = []
+        index = -1
+        # Have noticed using obj.getIndexInParent()
+        # returns -1, let the loop counts the child index
+        for child in node.acc:
+            index += 1
+            if not child:
+                continue
+            child_node = Node(child, index)
+            self._fetch_role(child_node)
+            if child_node.role is None:
+                # Some object bailed out
+                continue
+            if not self._utils._handle_table_cell and \
+                    child_node.role == pyatspi.ROLE_TABLE_CELL:
+                # In OO.o navigating table cells consumes more time
+                # resource
+                break
+            if details:
+                self._fetch_label(child_node)
+                self._fetch_extra(child_node)
+            children.append(child_node)
+        return children
+
+    def _fetch_role(self, node):
+        try:
+            node.role = property_memo.role(node.acc)
+        except:
+            node.role = None
+            return
+        node.abbrev_role = abbreviated_roles.get(node.role, 'ukn')
+
+    def _fetch_label(self, node):
+        """
+        Fetch what the LDTP name and the appmap indexes are derived from
+        """
+        acc = node.acc
+        node.role_name = self._get_role_name(acc, node.role)
+        try:
+            node.name = property_memo.name(acc)
+        except:
+            node.name = ''
+        if node.role in window_roles:
+            strip = WINDOW_STRIP
+        else:
+            strip = OBJECT_STRIP
+        label_acc = self._utils._get_label_accessible(acc)
+        if label_acc:
+            try:
+                # Priority to associated label
+                node.label_by = property_memo.name(label_acc) or ''
+            except:
+                node.label_by = ''
+            label = node.label_by
+        else:
+            label = node.name
+        try:
+            # Labels are mostly unique, not worth the pattern cache
+            node.label = strip.sub('', label)
+        except:
+            node.label = ''
+
+    def _fetch_extra(self, node):
+        try:
+            node.description = node.acc.description
+        except:
+            node.description = ''
+        node.key_binding = self._get_key_binding(node.acc)
+
+    def _get_role_name(self, acc, role):
+        if role in self._role_names:
+            return self._role_names[role]
+        role_name = property_memo.role_name(acc).replace(' ', '_')
+        if role in abbreviated_roles:
+            # Extended / unknown roles can have per object role names
+            self._role_names[role] = role_name
+        return role_name
+
+    def _get_key_binding(self, acc):
+        try:
+            iaction = acc.queryAction()
+            for j in xrange(iaction.nActions):
+                key_binding = iaction.getKeyBinding(j)
+                if key_binding != '':
+                    return key_binding
+        except NotImplementedError:
+            pass
+        return ''
+
+    def get_app_name(self, acc):
+        """
+        Get application name of the crawled window, fetched once per crawl
+        """
+        if self._app_name is None:
+            self._app_name = acc.getApplication().name
+        return self._app_name
+
+class LazyCrawl(object):
+    """
+    Depth first crawl of a window, which adds one object at a time to
+    the appmap, so that a lookup can stop as soon as the object is
+    added, and a later full map resumes where the lookup stopped.
+
+    Objects are added in the order Utils._add_appmap_nodes adds them, so
+    the LDTP names of the crawled objects are the same as with a full
+    crawl. Description and key binding are not needed to find an
+    object, they are fetched when the crawl is completed
+    """
+    def __init__(self, utils, appmap, acc, parent, index):
+        """
+        @param utils: Utils instance, names the objects
+        @type utils: object
+        @param appmap: Appmap to populate
+        @type appmap: object
+        @param acc: Window handle
+        @type acc: object
+        @param parent: LDTP name of the window parent
+        @type parent: string
+        @param index: Index of the window in its parent
+        @type index: integer
+        """
+        self._utils = utils
+        self.crawler = Crawler(utils)
+        self.appmap = appmap
+        self.window = acc
+        # Per role counters, continued on resume
+        self.obj_index = {}
+        root = Node(acc, index)
+        self.crawler._fetch_role(root)
+        if root.role is None:
+            raise LookupError('Unable to fetch accessible')
+        # (node, parent name, add node) in the order they are added
+        self._stack = [(root, parent, index != -1)]
+        # (node, LDTP name) of the objects added without the extras
+        self._deferred = []
+
+    def done(self):
+        return not self._stack
+
+    def _add(self, node, parent):
+        utils = self._utils
+        utils.ldtpized_list = self.appmap
+        utils.ldtpized_obj_index = self.obj_index
+        return utils._add_appmap_data(node, parent, node.index, self.crawler)
+
+    def next(self):
+        """
+        Add the next object to the appmap
+
+        @return: LDTP name of the object added, None if nothing was
+        added (root of a children only crawl)
+        @rtype: string
+        """
+        node, parent, add = self._stack.pop()
+        name = None
+        if add:
+            self.crawler._fetch_label(node)
+            name = self._add(node, parent)
+            self._deferred.append((node, name))
+            parent = name
+        # Labels are fetched as the children are added
+        children = self.crawler._fetch_child_nodes(node, False)
+        for child in reversed(children):
+            self._stack.append((child, parent, True))
+        return name
+
+    def finish(self):
+        """
+        Crawl the rest of the window and fetch the skipped extras
+        """
+        while self._stack:
+            node, parent, add = self._stack.pop()
+            # Rest of the subtree is fetched breadth first
+            subtree = self.crawler.fetch(node.acc, node.index)
+            utils = self._utils
+            utils.ldtpized_list = self.appmap
+            utils.ldtpized_obj_index = self.obj_index
+            utils._add_appmap_nodes(subtree, parent, self.crawler, add)
+        for node, name in self._deferred:
+            self.crawler._fetch_extra(node)
+            entry = self.appmap.get(name)
+            if entry is None:
+                continue
+            entry.description = node.description
+            entry.key_binding = intern_string(node.key_binding)
+        self._deferred = []
+        return self.appmap
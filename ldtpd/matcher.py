@@ -0,0 +1,244 @@
+"""
+LDTP v2 matcher.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from fnmatch import translate as glob_trans
+
+# regex flags Multi-line, Unicode, Locale
+GLOB_FLAGS = re.M | re.U | re.L
+
+# Window titles just loose space and new line, all other object
+# types loose space, colon, dot, underscore and new line
+WINDOW_STRIP = re.compile('( |\n)')
+OBJECT_STRIP = re.compile('( |:|\.|_|\n)')
+SPACE_STRIP = re.compile(' ')
+# Characters with special meaning in a Unix glob
+GLOB_CHARS = re.compile('[*?[]')
+
+# Appmap class names, for which only space and new line are stripped
+WINDOW_CLASSES = frozenset(['frame', 'dialog', 'window', 'font_chooser',
+                            'file_chooser', 'alert', 'color_chooser'])
+
+def is_glob(pattern):
+    """
+    Check whether the pattern has to be glob matched or an
+    exact string comparison does the same job
+    """
+    return bool(GLOB_CHARS.search(pattern))
+
+def strip_for_class(class_name):
+    """
+    Get the strip regex used for the given appmap class
+    """
+    if class_name in WINDOW_CLASSES:
+        return WINDOW_STRIP
+    return OBJECT_STRIP
+
+class Locator(object):
+    """
+    Window / object name given by the caller, compiled once per query.
+
+    Matching used to derive the stripped names and translate the globs
+    again for every candidate of a scan. The locator keeps those
+    variants, and compares names without wildcards as plain strings,
+    which is what the anchored glob regex did at a higher cost
+    """
+    __slots__ = ('name', 'glob', '_regex', '_unicode_regex', '_stripped')
+
+    def __init__(self, name):
+        self.name = name
+        self.glob = is_glob(name)
+        self._regex = None
+        self._unicode_regex = None
+        # strip regex pattern -> Locator of the stripped name
+        self._stripped = {}
+
+    def __nonzero__(self):
+        return bool(self.name)
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return 'Locator(%r)' % (self.name,)
+
+    def match(self, string):
+        """
+        Match given string
+
+        @param string: accessible / appmap name
+        @type string: string
+
+        @return: True on match
+        @rtype: boolean
+        """
+        if not self.glob:
+            return string == self.name
+        if self._regex is None:
+            self._regex = re.compile(glob_trans(self.name), GLOB_FLAGS)
+        return bool(self._regex.match(string))
+
+    def match_unicode(self, string):
+        """
+        Match given string, decoded accessible name, without the
+        locale dependent regex flag
+        """
+        if not self.glob:
+            return string == self.name
+        if self._unicode_regex is None:
+            self._unicode_regex = re.compile(glob_trans(self.name),
+                                             re.M | re.U)
+        return bool(self._unicode_regex.match(string))
+
+    def stripped(self, strip=OBJECT_STRIP):
+        """
+        Get locator of the name with the given strip regex applied
+
+        @param strip: One of WINDOW_STRIP, OBJECT_STRIP, SPACE_STRIP
+        @type strip: object
+
+        @return: locator
+        @rtype: object
+        """
+        locator = self._stripped.get(strip.pattern)
+        if locator is None:
+            locator = self._stripped[strip.pattern] = \
+                Locator(strip.sub('', self.name))
+        return locator
+
+class PatternCache(object):
+    """
+    Bounded LRU of compiled glob matchers and stripped names.
+
+    Every lookup used to run fnmatch.translate + re.compile on the same
+    handful of locators thousands of times per appmap scan, now each
+    (pattern, flags) pair is compiled once
+    """
+    def __init__(self, size=2048):
+        self._size = size
+        self._patterns = OrderedDict()
+        self._stripped = OrderedDict()
+        self._locators = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            try:
+                value = cache.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            # Move to the most recently used end
+            cache[key] = value
+            self.hits += 1
+            return value
+
+    def _store(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self._size:
+                # Drop least recently used entry
+                cache.popitem(last=False)
+        return value
+
+    def glob(self, pattern, flags=GLOB_FLAGS):
+        """
+        Get compiled regex for the given glob pattern
+
+        @param pattern: Unix glob
+        @type pattern: string
+        @param flags: regex flags
+        @type flags: integer
+
+        @return: compiled regex
+        @rtype: object
+        """
+        key = (pattern, flags)
+        compiled = self._lookup(self._patterns, key)
+        if compiled is None:
+            compiled = self._store(self._patterns, key,
+                                   re.compile(glob_trans(pattern), flags))
+        return compiled
+
+    def strip(self, name, strip=OBJECT_STRIP):
+        """
+        Get name with the given strip regex applied
+
+        @param name: Name to be stripped
+        @type name: string
+        @param strip: One of WINDOW_STRIP, OBJECT_STRIP, SPACE_STRIP
+        @type strip: object
+
+        @return: stripped name
+        @rtype: string
+        """
+        key = (name, strip.pattern)
+        stripped = self._lookup(self._stripped, key)
+        if stripped is None:
+            stripped = self._store(self._stripped, key, strip.sub('', name))
+        return stripped
+
+    def locator(self, name):
+        """
+        Get compiled locator of the given name, a locator is returned
+        as is
+
+        @param name: Window / object name, either full name, LDTP's
+        name convention, or a Unix glob
+        @type name: string
+
+        @return: locator
+        @rtype: object
+        """
+        if isinstance(name, Locator):
+            return name
+        locator = self._lookup(self._locators, name)
+        if locator is None:
+            locator = self._store(self._locators, name, Locator(name))
+        return locator
+
+    def glob_match(self, pattern, string, flags=GLOB_FLAGS):
+        """
+        Match given string, by escaping regex characters
+        """
+        return bool(self.glob(pattern, flags).match(string))
+
+    def stats(self):
+        """
+        Get cache counters
+
+        @return: hits, misses and current size
+        @rtype: dict
+        """
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'size' : len(self._patterns) + len(self._stripped) + \
+                    len(self._locators)}
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self._stripped.clear()
+            self._locators.clear()
+            self.hits = self.misses = 0
+
+# Shared by all Utils instances (daemon and waiters)
+pattern_cache = PatternCache()
@@ -0,0 +1,266 @@
+"""
+LDTP v2 memo.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import time
+import threading
+
+_missing = object()
+
+class PropertyMemo(object):
+    """
+    Accessible properties fetched during the current request.
+
+    While serving one command, the same accessible is asked for its
+    role, role name, name and label many times over, each being a D-Bus
+    round trip with at-spi2. Properties are memoized only while a
+    request is served, between begin_request and end_request, and the
+    properties of an accessible are forgotten on its AT-SPI events, so
+    the values are never older than the command / the last change.
+    Outside of requests, ex: wait polls and timers, every property is
+    fetched
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self._active = False
+        # Properties fetched / served from the memo, current request
+        self.fetched = 0
+        self.saved = 0
+        # Totals, all requests
+        self.total_fetched = 0
+        self.total_saved = 0
+
+    def get(self, acc, prop, fetch, *args):
+        """
+        Get the memoized property, fetch it on first access
+
+        @param acc: Accessible handle
+        @type acc: object
+        @param prop: Property name
+        @type prop: string
+        @param fetch: Called with args to fetch the property
+        @type fetch: function
+
+        @return: property value
+        @rtype: object
+        """
+        if not self._active:
+            value = fetch(*args)
+            with self._lock:
+                self.fetched += 1
+            return value
+        try:
+            values = self._values.get(acc)
+        except TypeError:
+            # Unhashable accessible, can't be memoized
+            return fetch(*args)
+        if values is not None:
+            value = values.get(prop, _missing)
+            if value is not _missing:
+                with self._lock:
+                    self.saved += 1
+                return value
+        value = fetch(*args)
+        with self._lock:
+            if self._active:
+                self._values.setdefault(acc, {})[prop] = value
+            self.fetched += 1
+        return value
+
+    def role(self, acc):
+        return self.get(acc, 'role', acc.getRole)
+
+    def role_name(self, acc):
+        return self.get(acc, 'role_name', acc.getRoleName)
+
+    def name(self, acc):
+        return self.get(acc, 'name', getattr, acc, 'name')
+
+    def forget(self, acc):
+        """
+        Forget the properties of the accessible, it sent an event.
+        Role and role name don't change, a new name comes with an
+        event of the renamed accessible itself
+
+        @param acc: Accessible handle
+        @type acc: object
+        """
+        with self._lock:
+            try:
+                self._values.pop(acc, None)
+            except TypeError:
+                # Unhashable accessible, never memoized
+                pass
+
+    def begin_request(self):
+        """
+        Memoize the properties fetched till end_request
+        """
+        with self._lock:
+            self._values.clear()
+            self._active = True
+            # Fetched outside of requests
+            self.total_fetched += self.fetched
+            self.fetched = self.saved = 0
+
+    def end_request(self):
+        """
+        Forget all the properties, stop memoizing and reset the request
+        counters
+
+        @return: properties fetched, properties served from the memo
+        @rtype: tuple
+        """
+        with self._lock:
+            self._values.clear()
+            self._active = False
+            fetched, saved = self.fetched, self.saved
+            self.total_fetched += fetched
+            self.total_saved += saved
+            self.fetched = self.saved = 0
+        return fetched, saved
+
+    def stats(self):
+        """
+        Get memo counters
+
+        @return: properties fetched and served from the memo, in all
+        the requests
+        @rtype: dict
+        """
+        return {'fetched' : self.total_fetched + self.fetched,
+                'saved' : self.total_saved + self.saved}
+
+class NegativeCache(object):
+    """
+    Existence probes which found nothing, for a short while.
+
+    Test scripts probe in tight loops for windows / objects which are
+    usually absent, each miss costs a window scan or a forced remap.
+    Misses are answered from the cache until the TTL expires, or until
+    an event of the application owning the probed window arrives,
+    whichever is first. Misses of absent windows are forgotten on the
+    window events of any application
+    """
+    def __init__(self, ttl):
+        # Seconds, 0 disables the cache
+        self.ttl = ttl
+        # Probe -> expiry, application of the probed window or None
+        self._misses = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def _app_key(self, app):
+        try:
+            hash(app)
+            return app
+        except TypeError:
+            return id(app)
+
+    def hit(self, key):
+        """
+        Check whether the probe missed recently
+
+        @param key: Probe name, window / object locators
+        @type key: tuple
+
+        @return: True if the probe can be answered as not found
+        @rtype: boolean
+        """
+        if not self.ttl:
+            return False
+        miss = self._misses.get(key)
+        if miss is None:
+            return False
+        if miss[0] < time.time():
+            with self._lock:
+                self._misses.pop(key, None)
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, key, app=None):
+        """
+        Remember the probe found nothing
+
+        @param key: Probe name, window / object locators
+        @type key: tuple
+        @param app: Application of the probed window, None if the
+        window wasn't found
+        @type app: object
+        """
+        if not self.ttl:
+            return
+        if app is not None:
+            app = self._app_key(app)
+        with self._lock:
+            self._misses[key] = (time.time() + self.ttl, app)
+            self.stores += 1
+
+    def invalidate(self, app, windows=False):
+        """
+        Forget the misses in the windows of the application, it sent
+        an event
+
+        @param app: Application handle
+        @type app: object
+        @param windows: Forget the misses of absent windows too, the
+        windows of the application might have changed
+        @type windows: boolean
+        """
+        if not self._misses:
+            return
+        if app is not None:
+            app = self._app_key(app)
+        with self._lock:
+            for key, (expiry, owner) in list(self._misses.items()):
+                if (owner is not None and owner == app) or \
+                        (owner is None and windows):
+                    del self._misses[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        """
+        Forget all the misses
+        """
+        if not self._misses:
+            return
+        with self._lock:
+            self._misses.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """
+        Get negative cache counters
+
+        @return: hits, stores, invalidations and current entries
+        @rtype: dict
+        """
+        return {'hits' : self.hits,
+                'stores' : self.stores,
+                'invalidations' : self.invalidations,
+                'entries' : len(self._misses)}
+
+# Shared by all Utils instances (daemon and waiters)
+property_memo = PropertyMemo()
+negative_cache = NegativeCache(
+    float(os.environ.get('LDTP_NEGATIVE_CACHE_TTL', 0.5)))
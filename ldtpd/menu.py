@@ -22,6 +22,7 @@ Headers in this file shall remain intact.
 import re
 import pyatspi 
 from utils import Utils
+from memo import negative_cache
 
 class Menu(Utils):
     def selectmenuitem(self, window_name, object_name):
@@ -64,6 +65,10 @@ class Menu(Utils):
         @return: 1 on success.
         @rtype: integer
         """
+        key = ('doesmenuitemexist', window_name, object_name,
+               bool(strict_hierarchy))
+        if negative_cache.hit(key):
+            return 0
         try:
             if strict_hierarchy or re.search(';', object_name):
                 obj = self._get_menu_hierarchy(window_name, object_name,
@@ -72,6 +77,7 @@ class Menu(Utils):
                 obj = self._get_object(window_name, object_name, False)
             return 1
         except:
+            negative_cache.add(key, self._window_app(window_name))
             return 0
 
     def listsubmenus(self, window_name, object_name):
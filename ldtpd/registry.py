@@ -0,0 +1,368 @@
+"""
+LDTP v2 registry.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import time
+from collections import OrderedDict
+
+# Minimum seconds between two desktop application list resyncs
+RESYNC_INTERVAL = 1.0
+
+class WindowRecord(object):
+    """
+    Registered window, with the strings used to match window names
+    """
+    __slots__ = ('gui', 'name', 'title', 'abbrev_role', 'label',
+                 'label_by', 'is_window')
+
+    def __init__(self, gui, name, title, abbrev_role, label, label_by,
+                 is_window):
+        self.gui = gui
+        # Unique LDTP window name
+        self.name = name
+        # Accessible name as is
+        self.title = title
+        self.abbrev_role = abbrev_role
+        # Stripped name (associated / direct)
+        self.label = label
+        self.label_by = label_by
+        # Window type role, decides how the given name is stripped
+        self.is_window = is_window
+
+class WindowRegistry(object):
+    """
+    Open windows keyed by their LDTP window name, in the order they
+    were enumerated / created.
+
+    Names are derived as the window enumeration always did: role
+    abbreviation and stripped title, role abbreviation and a per role
+    counter for untitled windows, and a numeric suffix when the name
+    is already taken
+    """
+    def __init__(self):
+        self._windows = OrderedDict()
+        self._names = {}
+        # Set once the registry was populated from the desktop
+        self.scanned = False
+        self.rescans = 0
+
+    def _unique_name(self, abbrev_role, label):
+        if label == '':
+            # If the same window type repeats eg: multiple dialog window
+            # with empty title, then use, dlg0, dlg1, dlg2 etc
+            index = 0
+            while '%s%d' % (abbrev_role, index) in self._windows:
+                index += 1
+            return '%s%d' % (abbrev_role, index)
+        try:
+            w_name = name = '%s%s' % (abbrev_role, label)
+        except UnicodeDecodeError:
+            w_name = name = '%s%s' % (abbrev_role, label.decode('utf-8'))
+        # If multiple window with same title, increment the index
+        index = 1
+        while name in self._windows:
+            name = '%s%d' % (w_name, index)
+            index += 1
+        return name
+
+    def add(self, gui, title, abbrev_role, label, label_by, is_window):
+        """
+        Register window
+
+        @return: LDTP window name
+        @rtype: string
+        """
+        name = self.name_of(gui)
+        if name:
+            return name
+        name = self._unique_name(abbrev_role, label)
+        self._windows[name] = WindowRecord(gui, name, title, abbrev_role,
+                                           label, label_by, is_window)
+        try:
+            self._names[gui] = name
+        except TypeError:
+            pass
+        return name
+
+    def remove(self, gui):
+        """
+        Unregister window
+
+        @return: LDTP window name, None if it wasn't registered
+        @rtype: string
+        """
+        name = self.name_of(gui)
+        if name:
+            del self._windows[name]
+            del self._names[gui]
+        return name
+
+    def name_of(self, gui):
+        try:
+            return self._names.get(gui)
+        except TypeError:
+            return None
+
+    def get(self, name):
+        """
+        Get window record of the given LDTP window name, or None
+        """
+        return self._windows.get(name)
+
+    def records(self):
+        return list(self._windows.values())
+
+    def names(self):
+        return list(self._windows.keys())
+
+    def clear(self):
+        self._windows.clear()
+        self._names.clear()
+        self.scanned = False
+
+    def __len__(self):
+        return len(self._windows)
+
+class AppRecord(object):
+    """
+    Application in the application table
+    """
+    __slots__ = ('app', 'remap', 'cache_mask', 'last_event')
+
+    def __init__(self, app, remap=True):
+        self.app = app
+        # Application objects got added / removed / changed, the cached
+        # appmaps of its windows have to be remapped on next access
+        self.remap = remap
+        # Cache mask set on the application, None if not set yet
+        self.cache_mask = None
+        # Time of the last window / children / name event of the
+        # application, None if there was none yet
+        self.last_event = None
+
+class AppTable(object):
+    """
+    Accessible applications keyed by their handle. at-spi hands out
+    one proxy per application, so the handle is a stable identity.
+
+    Replaces the list of [app, remap flag] pairs, which had to be
+    scanned linearly for every window event and lookup
+    """
+    def __init__(self, resync_interval=RESYNC_INTERVAL):
+        self._apps = OrderedDict()
+        self._resync_interval = resync_interval
+        self._last_resync = None
+        self.resyncs = 0
+
+    def _key(self, app):
+        try:
+            hash(app)
+            return app
+        except TypeError:
+            return id(app)
+
+    def add(self, app, remap=True):
+        """
+        Add application, if not in the table already
+
+        @return: application record
+        @rtype: object
+        """
+        key = self._key(app)
+        record = self._apps.get(key)
+        if record is None:
+            record = self._apps[key] = AppRecord(app, remap)
+        return record
+
+    def get(self, app):
+        """
+        Get application record, or None
+        """
+        if app is None:
+            return None
+        return self._apps.get(self._key(app))
+
+    def remove(self, app):
+        return self._apps.pop(self._key(app), None)
+
+    def mark_remap(self, app):
+        record = self.get(app)
+        if record:
+            record.remap = True
+
+    def mark_all_remap(self):
+        for record in self._apps.values():
+            record.remap = True
+
+    def touch(self, app):
+        """
+        Record that the application sent an event just now
+        """
+        record = self.get(app)
+        if record:
+            record.last_event = time.time()
+
+    def take_remap(self, app):
+        """
+        Get and reset the remap flag of the application
+
+        @return: True if the application windows have to be remapped
+        @rtype: boolean
+        """
+        record = self.get(app)
+        if record and record.remap:
+            record.remap = False
+            return True
+        return False
+
+    def records(self):
+        return list(self._apps.values())
+
+    def apps(self):
+        return [record.app for record in self._apps.values()]
+
+    def resync_due(self):
+        """
+        Check whether the resync interval elapsed since last resync
+        """
+        return self._last_resync is None or \
+            time.time() - self._last_resync >= self._resync_interval
+
+    def resync(self, apps):
+        """
+        Sync with the applications currently on the desktop, flags of
+        the known applications are retained
+
+        @param apps: application handles on the desktop
+        @type apps: list
+
+        @return: records of the applications added
+        @rtype: list
+        """
+        current = OrderedDict()
+        for app in apps:
+            current[self._key(app)] = app
+        for key in list(self._apps.keys()):
+            if key not in current:
+                del self._apps[key]
+        added = []
+        for key, app in current.items():
+            if key not in self._apps:
+                record = self._apps[key] = AppRecord(app)
+                added.append(record)
+        self._last_resync = time.time()
+        self.resyncs += 1
+        return added
+
+    def __len__(self):
+        return len(self._apps)
+
+# Prefix of the object handle ids handed out to the clients
+HANDLE_PREFIX = 'ldtphandle#'
+
+class HandleRecord(object):
+    """
+    Object resolved for a client, by getobjecthandle
+    """
+    __slots__ = ('handle', 'window_name', 'object_name', 'acc',
+                 'role_name', 'name')
+
+    def __init__(self, handle, window_name, object_name):
+        self.handle = handle
+        # Names as given by the client, resolved again once stale
+        self.window_name = window_name
+        self.object_name = object_name
+        self.acc = None
+        # Role name and name when resolved, to detect an accessible
+        # reused for some other object
+        self.role_name = None
+        self.name = None
+
+class HandleTable(object):
+    """
+    Object handles handed out to the clients, keyed by handle id.
+
+    Lets the client pass the handle in place of the object name, so
+    that the object is resolved once for many operations. The least
+    recently used handles are dropped beyond the given size, a dropped
+    handle is unknown to the daemon
+    """
+    def __init__(self, size=1024):
+        self._size = size
+        self._handles = OrderedDict()
+        # (window name, object name) -> handle id
+        self._ids = {}
+        # Handles of an earlier daemon instance aren't mistaken for ours
+        self._prefix = '%s%x#' % (HANDLE_PREFIX, int(time.time() * 1000))
+        self._next_id = 0
+        self.hits = 0
+        self.reresolves = 0
+
+    def is_handle(self, name):
+        try:
+            return name.startswith(HANDLE_PREFIX)
+        except AttributeError:
+            return False
+
+    def add(self, window_name, object_name):
+        """
+        Get the handle of the given object, a new one if there is none
+
+        @return: handle record
+        @rtype: object
+        """
+        handle = self._ids.get((window_name, object_name))
+        if handle:
+            return self.get(handle)
+        handle = '%s%d' % (self._prefix, self._next_id)
+        self._next_id += 1
+        record = self._handles[handle] = HandleRecord(handle, window_name,
+                                                      object_name)
+        self._ids[(window_name, object_name)] = handle
+        while len(self._handles) > self._size:
+            self._drop(next(iter(self._handles)))
+        return record
+
+    def get(self, handle):
+        """
+        Get handle record, or None
+        """
+        record = self._handles.pop(handle, None)
+        if record is not None:
+            # Move to the most recently used end
+            self._handles[handle] = record
+        return record
+
+    def remove(self, handle):
+        """
+        Forget the handle
+
+        @return: True if the handle was known
+        @rtype: boolean
+        """
+        if handle not in self._handles:
+            return False
+        self._drop(handle)
+        return True
+
+    def _drop(self, handle):
+        record = self._handles.pop(handle)
+        self._ids.pop((record.window_name, record.object_name), None)
+
+    def __len__(self):
+        return len(self._handles)
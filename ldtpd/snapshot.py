@@ -0,0 +1,239 @@
+"""
+LDTP v2 snapshot.
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import stat
+import hashlib
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from appmap import Appmap, AppmapEntry
+
+# Bump when the snapshot layout changes, older snapshots are ignored
+SNAPSHOT_VERSION = 2
+# Snapshots kept, the least recently used ones are removed
+MAX_SNAPSHOTS = 256
+# Snapshots of new windows saved between two prunes of the directory
+PRUNE_INTERVAL = 16
+
+def fingerprint(probe):
+    """
+    Get structural fingerprint of a window
+
+    @param probe: Strings / numbers describing the window structure
+    @type probe: list
+
+    @return: hex digest
+    @rtype: string
+    """
+    digest = hashlib.sha1()
+    for value in probe:
+        if not isinstance(value, bytes):
+            value = (u'%s' % (value,)).encode('utf-8')
+        digest.update(value)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class SnapshotStore(object):
+    """
+    Appmaps serialized to disk, so that a restarted daemon can skip
+    crawling the windows which didn't change.
+
+    Snapshots are keyed by application name and LDTP window name, one
+    per window, and are used only if the structural fingerprint of the
+    window didn't change. They are read only when a window is looked
+    up the first time. Snapshots are pickled, so the directory is used
+    only if it is owned by the user and not writable by anyone else
+    """
+    def __init__(self, directory, max_snapshots=MAX_SNAPSHOTS):
+        self._directory = directory
+        self._max_snapshots = max_snapshots
+        # Path -> digest of the snapshot last loaded / saved, unchanged
+        # snapshots aren't written again
+        self._digests = {}
+        # New snapshots saved since the last prune, first one prunes
+        self._unpruned = PRUNE_INTERVAL
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        # Snapshots loaded, which turned out not to match the window
+        self.stale = 0
+        self.pruned = 0
+        # Loads / saves refused, the directory isn't private
+        self.refused = 0
+
+    def _is_private(self):
+        """
+        Check the directory is owned by the user and isn't writable by
+        the group / others, who could plant a snapshot
+
+        @return: True if the snapshots can be trusted
+        @rtype: boolean
+        """
+        try:
+            st = os.stat(self._directory)
+        except OSError:
+            return False
+        if st.st_uid != os.getuid() or \
+                st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            self.refused += 1
+            return False
+        return True
+
+    def _path(self, app_name, window_name):
+        key = fingerprint([SNAPSHOT_VERSION, app_name, window_name])
+        return os.path.join(self._directory, '%s.appmap' % key)
+
+    def load(self, app_name, window_name, window_fingerprint):
+        """
+        Load appmap snapshot
+
+        @return: appmap on success, else None
+        @rtype: object
+        """
+        if not self._is_private():
+            self.misses += 1
+            return None
+        path = self._path(app_name, window_name)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            snapshot = pickle.loads(data)
+            if snapshot['version'] != SNAPSHOT_VERSION:
+                raise ValueError('Snapshot version mismatch')
+            if snapshot['fingerprint'] != window_fingerprint:
+                raise ValueError('Window structure changed')
+            appmap = self._to_appmap(snapshot)
+            # Recently used, see _prune
+            os.utime(path, None)
+        except Exception:
+            # Not found / truncated / older format, crawl again
+            self.misses += 1
+            return None
+        self._digests[path] = hashlib.sha1(data).hexdigest()
+        self.hits += 1
+        return appmap
+
+    def save(self, app_name, window_name, window_fingerprint, appmap):
+        """
+        Save appmap snapshot, replacing the earlier one of the window
+        atomically, unless it didn't change
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory, 0o700)
+        if not self._is_private():
+            return
+        path = self._path(app_name, window_name)
+        snapshot = self._from_appmap(appmap)
+        snapshot['fingerprint'] = window_fingerprint
+        data = pickle.dumps(snapshot, 2)
+        digest = hashlib.sha1(data).hexdigest()
+        if self._digests.get(path) == digest and os.path.exists(path):
+            # Same as on disk
+            return
+        created = not os.path.exists(path)
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.rename(tmp_path, path)
+        except:
+            os.unlink(tmp_path)
+            raise
+        self._digests[path] = digest
+        self.saves += 1
+        if created:
+            # Rewrites don't add snapshots, prune once in a while as
+            # new ones get added
+            self._unpruned += 1
+            if self._unpruned >= PRUNE_INTERVAL:
+                self._unpruned = 0
+                self._prune()
+
+    def _prune(self):
+        """
+        Remove the least recently used snapshots beyond max_snapshots,
+        windows with changing titles leave a snapshot each. Up to
+        PRUNE_INTERVAL more can be there between two prunes
+        """
+        paths = [os.path.join(self._directory, name)
+                 for name in os.listdir(self._directory)
+                 if name.endswith('.appmap')]
+        if len(paths) <= self._max_snapshots:
+            return
+        used = []
+        for path in paths:
+            try:
+                used.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed meanwhile
+                continue
+        used.sort()
+        for mtime, path in used[:len(used) - self._max_snapshots]:
+            try:
+                os.unlink(path)
+                self._digests.pop(path, None)
+                self.pruned += 1
+            except OSError:
+                pass
+
+    def _from_appmap(self, appmap):
+        entries = []
+        # Entries in id order, parents are stored before their children
+        for entry in appmap._entries:
+            if entry is None:
+                continue
+            entries.append((entry.key, entry.parent, entry.class_name,
+                            entry.child_index, entry.children_names(),
+                            entry.obj_index, entry.label, entry.label_by,
+                            entry.description, entry.key_binding))
+        return {'version' : SNAPSHOT_VERSION,
+                'obj_index' : dict(appmap.obj_index),
+                'entries' : entries}
+
+    def _to_appmap(self, snapshot):
+        appmap = Appmap()
+        appmap.obj_index = snapshot['obj_index']
+        for key, parent, class_name, child_index, children, obj_index, \
+                label, label_by, description, key_binding \
+                in snapshot['entries']:
+            appmap[key] = AppmapEntry(key, parent, class_name, child_index,
+                                      obj_index, label, label_by,
+                                      description, key_binding)
+        for entry in snapshot['entries']:
+            for child in entry[4]:
+                appmap.add_child(entry[0], child)
+        return appmap
+
+    def stats(self):
+        """
+        Get snapshot counters
+
+        @return: hits, misses, stale, saves, pruned and refused
+        @rtype: dict
+        """
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'stale' : self.stale,
+                'saves' : self.saves,
+                'pruned' : self.pruned,
+                'refused' : self.refused}
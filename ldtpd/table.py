@@ -22,6 +22,7 @@ import re
 import time
 import pyatspi 
 from utils import Utils
+from matcher import pattern_cache
 from server_exception import LdtpServerException
 from keypress_actions import KeyComboAction, KeyPressAction, KeyReleaseAction
 
@@ -74,6 +75,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -90,13 +93,13 @@ class Table(Utils):
                             self._handle_table_cell = True
                         children = self._list_objects(cell)
                         for child in children:
-                            if self._match_name_to_acc(row_text, child):
+                            if self._match_name_to_acc(row_locator, child):
                                 self._grab_focus(child)
                                 return 1
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     return 1
         raise LdtpServerException('Unable to select row: %s' % row_text)
@@ -124,6 +127,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -146,7 +151,7 @@ class Table(Utils):
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     return 1
         raise LdtpServerException('Unable to select row: %s' % row_text)
@@ -183,6 +188,8 @@ class Table(Utils):
         try:
             for row_text in row_text_list:
                 selected_rows = False
+                # Matched against every cell, compile once
+                row_locator = pattern_cache.locator(row_text)
                 for i in range(0, tablei.nRows):
                     for j in range(0, tablei.nColumns):
                         cell = tablei.getAccessibleAt(i, j)
@@ -199,7 +206,7 @@ class Table(Utils):
                                     self._handle_table_cell = True
                                 children = self._list_objects(cell)
                                 for child in children:
-                                    if self._match_name_to_acc(row_text, child):
+                                    if self._match_name_to_acc(row_locator, child):
                                         time.sleep(1)
                                         size = self._get_size(cell)
                                         if pyatspi.state.STATE_SELECTED not \
@@ -214,7 +221,7 @@ class Table(Utils):
                             finally:
                                 if not flag:
                                     self._handle_table_cell = False
-                        elif self._match_name_to_acc(row_text, cell):
+                        elif self._match_name_to_acc(row_locator, cell):
                             time.sleep(1)
                             size = self._get_size(cell)
                             if pyatspi.state.STATE_SELECTED not \
@@ -263,6 +270,8 @@ class Table(Utils):
         try:
             for row_text in row_text_list:
                 unselected_rows = False
+                # Matched against every cell, compile once
+                row_locator = pattern_cache.locator(row_text)
                 for i in range(0, tablei.nRows):
                     for j in range(0, tablei.nColumns):
                         cell = tablei.getAccessibleAt(i, j)
@@ -279,7 +288,7 @@ class Table(Utils):
                                     self._handle_table_cell = True
                                 children = self._list_objects(cell)
                                 for child in children:
-                                    if self._match_name_to_acc(row_text, child):
+                                    if self._match_name_to_acc(row_locator, child):
                                         time.sleep(1)
                                         size = self._get_size(cell)
                                         if pyatspi.state.STATE_SELECTED \
@@ -294,7 +303,7 @@ class Table(Utils):
                             finally:
                                 if not flag:
                                     self._handle_table_cell = False
-                        elif self._match_name_to_acc(row_text, cell):
+                        elif self._match_name_to_acc(row_locator, cell):
                             time.sleep(1)
                             size = self._get_size(cell)
                             if pyatspi.state.STATE_SELECTED \
@@ -574,6 +583,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -590,7 +601,7 @@ class Table(Utils):
                             self._handle_table_cell = True
                         children = self._list_objects(cell)
                         for child in children:
-                            if self._match_name_to_acc(row_text, child):
+                            if self._match_name_to_acc(row_locator, child):
                                 self._grab_focus(child)
                                 size = self._get_size(child)
                                 self._mouse_event(size.x + size.width / 2,
@@ -599,7 +610,7 @@ class Table(Utils):
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     size = self._get_size(cell)
                     self._mouse_event(size.x + size.width / 2,
@@ -803,6 +814,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -819,13 +832,13 @@ class Table(Utils):
                             self._handle_table_cell = True
                         children = self._list_objects(cell)
                         for child in children:
-                            if self._match_name_to_acc(row_text, child):
+                            if self._match_name_to_acc(row_locator, child):
                                 self._grab_focus(child)
                                 return i
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     return i
         raise LdtpServerException('Unable to get row index: %s' % row_text)
@@ -853,6 +866,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -869,7 +884,7 @@ class Table(Utils):
                             self._handle_table_cell = True
                         children = self._list_objects(cell)
                         for child in children:
-                            if self._match_name_to_acc(row_text, child):
+                            if self._match_name_to_acc(row_locator, child):
                                 self._grab_focus(child)
                                 size = self._get_size(cell)
                                 self._mouse_event(size.x + size.width / 2,
@@ -879,7 +894,7 @@ class Table(Utils):
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     size = self._get_size(cell)
                     self._mouse_event(size.x + size.width / 2,
@@ -911,6 +926,8 @@ class Table(Utils):
         except NotImplementedError:
             raise LdtpServerException('Object not table type.')
 
+        # Matched against every cell, compile once
+        row_locator = pattern_cache.locator(row_text)
         for i in range(0, tablei.nRows):
             for j in range(0, tablei.nColumns):
                 cell = tablei.getAccessibleAt(i, j)
@@ -927,7 +944,7 @@ class Table(Utils):
                             self._handle_table_cell = True
                         children = self._list_objects(cell)
                         for child in children:
-                            if self._match_name_to_acc(row_text, child):
+                            if self._match_name_to_acc(row_locator, child):
                                 self._grab_focus(child)
                                 size = self._get_size(cell)
                                 self._mouse_event(size.x + size.width / 2,
@@ -937,7 +954,7 @@ class Table(Utils):
                     finally:
                         if not flag:
                             self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
+                elif self._match_name_to_acc(row_locator, cell):
                     self._grab_focus(cell)
                     size = self._get_size(cell)
                     self._mouse_event(size.x + size.width / 2,
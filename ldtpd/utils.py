@@ -29,18 +29,28 @@ import pyatspi
 import threading
 import traceback
 import logging.handlers
+from collections import OrderedDict
 try:
   # If we have gtk3+ gobject introspection, use that
   from gi.repository import Gdk
+  from gi.repository import GObject as gobject
   gtk3 = True
 except:
   # No gobject introspection, use gtk2
   import gtk
+  import gobject
   gtk3 = False
 from re import match as re_match
-from constants import abbreviated_roles
+from constants import abbreviated_roles, window_roles
 from fnmatch import translate as glob_trans
 from server_exception import LdtpServerException
+from matcher import pattern_cache, strip_for_class, WINDOW_STRIP, \
+    OBJECT_STRIP, SPACE_STRIP
+from appmap import Appmap, AppmapEntry, AppmapStore
+from crawler import Crawler, CrawlPool, LazyCrawl
+from registry import WindowRegistry, AppTable, HandleTable
+from snapshot import SnapshotStore, fingerprint, MAX_SNAPSHOTS
+from memo import property_memo, negative_cache
 
 importStatGrab = False
 try:
@@ -162,12 +172,63 @@ class ProcessStats(threading.Thread):
         self._stop = True
         self.running = False
 
+# Maximum number of changed accessibles queued for incremental appmap
+# update, beyond that the application is just remapped
+MAX_PENDING_CHANGES = 1000
+# Window events are coalesced per source and applied in batches, at
+# most these many milliseconds after the first one of the batch
+WINDOW_EVENT_BATCH_MS = int(os.environ.get('LDTP_WINDOW_EVENT_BATCH_MS', 50))
+# Sources pending, beyond which the batch is applied right away
+MAX_PENDING_WINDOW_EVENTS = 500
+
 class Utils:
-    cached_apps = None
+    # Accessible applications and their remap flags, see AppTable
+    app_table = None
+    # Open windows, kept current from window events, see WindowRegistry
+    window_registry = None
+    # Appmaps are patched from object:children-changed and
+    # accessible-name events, instead of full window remap
+    incremental_appmap = 'LDTP_FULL_REMAP' not in os.environ
+    # Resolved accessible cache counters, see _get_resolved_accessible
+    handle_cache_stats = {'hits' : 0, 'misses' : 0, 'stale' : 0}
+    # Object handles handed out by getobjecthandle
+    object_handles = HandleTable()
+    # Windows / top level subtrees are crawled concurrently, in these
+    # many threads. Sequential by default, as not all at-spi versions
+    # handle calls from many threads
+    crawl_pool = CrawlPool(int(os.environ.get('LDTP_CRAWL_THREADS', 1)))
+    # Lazy crawl counters, see _lazy_get_object
+    lazy_crawl_stats = {'early_stops' : 0, 'completed' : 0, 'resumed' : 0}
+    # Window events received, applied after coalescing and batches
+    window_event_stats = {'received' : 0, 'applied' : 0, 'batches' : 0}
+    # Appmaps are saved to this directory, to skip crawling unchanged
+    # windows after daemon restart
+    appmap_snapshots = None
+    if os.environ.get('LDTP_APPMAP_CACHE'):
+        appmap_snapshots = SnapshotStore(
+            os.environ['LDTP_APPMAP_CACHE'],
+            int(os.environ.get('LDTP_APPMAP_CACHE_SIZE', MAX_SNAPSHOTS)))
+    # Unnamed / duplicate objects are named after their parent and
+    # position among the siblings of the same role, instead of the
+    # window wide counters, so that the names survive objects added /
+    # removed elsewhere in the window. Opt in, as the names differ from
+    # the ones recorded scripts use
+    stable_names = 'LDTP_STABLE_NAMES' in os.environ
+    # Cached appmaps budget, least recently used windows are dropped
+    # beyond these many objects / megabytes, 0 for no limit
+    appmap_max_entries = int(os.environ.get('LDTP_APPMAP_MAX_ENTRIES', 0))
+    appmap_max_mb = float(os.environ.get('LDTP_APPMAP_MAX_MB', 256))
+    # While an appmap subtree is patched, LDTP names and object indexes
+    # of the objects removed from it, see _patch_appmap
+    _patched_names = None
+    # Window name last looked up and its handle, None if it wasn't
+    # found, see _window_app
+    _last_window = (None, None)
     def __init__(self):
         lazy_load = True
         self._states = {}
-        self._appmap = {}
+        self._appmap = AppmapStore(self.appmap_max_entries,
+                                   int(self.appmap_max_mb * 1024 * 1024))
         self._callback = {}
         self._obj_timeout=5
         self._gui_timeout=30
@@ -177,7 +238,16 @@ class Utils:
         self._old_state_names = {}
         self._window_uptime = {}
         self._callback_event = []
+        # Accessibles whose children / name changed, since last lookup
+        self._appmap_changes = OrderedDict()
+        # Window name -> LazyCrawl stopped by an object lookup
+        self._partial_crawls = {}
+        # Window event source -> [source, event types, application],
+        # waiting for the batch to be applied
+        self._window_events = OrderedDict()
+        self._window_event_timer = None
         self._delaycmdexec = None
+        self._pacecmdexec = None
         self._get_all_state_names()
         self._handle_table_cell = False
         self._custom_logger = _custom_logger
@@ -186,31 +256,37 @@ class Utils:
         self._ldtp_debug_file = os.environ.get('LDTP_DEBUG_FILE', None)
         # Initialize atspi2 version to False
         self._atspi2_ver = False
-        if Utils.cached_apps is None:
+        if Utils.app_table is None:
             pyatspi.Registry.registerEventListener(
                 self._on_window_event, 'window')
             # Above window event doesn't get called for
             # 'window:destroy', so registering it individually
             pyatspi.Registry.registerEventListener(
                 self._on_window_event, 'window:destroy')
-            # Notify on any changes in all windows, based on this info,
-            # its decided, whether force_remap is required or not
-            # Commenting the following lines of code
-            # as it sucks the execution time in at-spi2
-            #pyatspi.Registry.registerEventListener(self._obj_changed, 
-            #                                       'object:children-changed')
-            #pyatspi.Registry.registerEventListener(
-            #    self._obj_changed, 'object:property-change:accessible-name')
-
-            Utils.cached_apps = list()
+            # Notify on any changes in all windows, based on this info
+            # the affected subtree of the cached appmap is patched.
+            # The callback just queues the source, as processing every
+            # event sucks the execution time in at-spi2
+            if Utils.incremental_appmap:
+                pyatspi.Registry.registerEventListener(
+                    self._obj_changed, 'object:children-changed')
+            else:
+                # Without children-changed events, cached misses could
+                # hide objects added meanwhile
+                negative_cache.ttl = 0
+            # Window titles are tracked by the window registry as well
+            pyatspi.Registry.registerEventListener(
+                self._obj_changed, 'object:property-change:accessible-name')
+
+            Utils.window_registry = WindowRegistry()
+            Utils.app_table = AppTable()
             if lazy_load:
                 for app in self._desktop:
                     if app is None: continue
-                    # app - Current open application a11y handle
-                    # True - It has to appmap'ed on need basis
-                    # (Means: On accessing window based on user request,
-                    # force remap)
-                    self.cached_apps.append([app, True])
+                    # Current open application a11y handle, it has to
+                    # appmap'ed on need basis (Means: On accessing window
+                    # based on user request, force remap)
+                    self.app_table.add(app)
         if self._ldtp_debug:
             _custom_logger.setLevel(logging.DEBUG)
         if gtk3:
@@ -237,8 +313,8 @@ class Utils:
 
     def _obj_changed(self, event):
         """
-        If window already in cached list, then mark for remap,
-        as the children have changed
+        Queue the accessible whose children / name have changed, the
+        cached appmap containing it is patched on next lookup
         """
         if self._ldtp_debug:
             try:
@@ -247,25 +323,159 @@ class Utils:
                 # With at-spi2, sometimes noticed exception
                 # ignore exception, as we just use them for debugging
                 pass
-        if not self.cached_apps:
-            # If not initialized as list, don't process further
+        if not event or not event.source:
             return
-        for app in self.cached_apps:
-            try:
-                if not app or not app[0] or app[0] != event.host_application:
-                    continue
-                # Force remap for this application, as some object is
-                # either added / removed / changed
-                index = self.cached_apps.index(app)
-                self.cached_apps[index][1] = True
-                # Just break, as the remap flag is set to true
+        # Memoized properties of the source / probe misses in the
+        # windows of the application might have changed. Windows are
+        # the children of the application
+        property_memo.forget(event.source)
+        negative_cache.invalidate(event.host_application,
+                                  event.source == event.host_application)
+        self.app_table.touch(event.host_application)
+        if event.type.startswith('object:children-changed'):
+            # Children of the source got added / removed
+            self._queue_appmap_change(event.source, False)
+            return
+        # Source got renamed, its LDTP name is derived from
+        # the name, so the entry has to be rebuilt
+        self._rename_window(event.source)
+        if self.incremental_appmap:
+            self._queue_appmap_change(event.source, True)
+
+    def _queue_appmap_change(self, acc, renamed):
+        for window_name, crawl in list(self._partial_crawls.items()):
+            if crawl.appmap.name_of(acc) is not None:
+                # Crawled part changed, crawl again on next lookup
+                del self._partial_crawls[window_name]
+        for appmap in self._appmap.values():
+            if appmap.name_of(acc) is not None:
                 break
-            except LookupError:
-                # A11Y lookup error
+        else:
+            # Not part of any cached appmap, nothing to patch
+            return
+        try:
+            renamed = self._appmap_changes.pop(acc, False) or renamed
+            self._appmap_changes[acc] = renamed
+        except TypeError:
+            # Unhashable accessible
+            return
+        if len(self._appmap_changes) > MAX_PENDING_CHANGES:
+            # Too many changes, patching costs more than remapping
+            self._evict_changed_appmaps()
+
+    def _evict_changed_appmaps(self):
+        """
+        Drop the queued changes along with the cached appmaps they
+        belong to, the windows are crawled again on next lookup
+        """
+        changed = list(self._appmap_changes.keys())
+        self._appmap_changes.clear()
+        for appmap in list(self._appmap.values()):
+            for acc in changed:
+                if appmap.name_of(acc) is not None:
+                    break
+            else:
+                continue
+            if appmap.window is not None:
+                self._appmap.evict(appmap.window)
+
+    def _apply_appmap_changes(self, appmap):
+        """
+        Patch the appmap subtrees affected by the queued changes
+
+        @param appmap: application map of window
+        @type appmap: object
+
+        @return: True if the appmap is up to date, False if the
+        window has to be remapped
+        @rtype: boolean
+        """
+        if not self._appmap_changes:
+            return True
+        dirty = {}
+        for acc, renamed in list(self._appmap_changes.items()):
+            name = appmap.name_of(acc)
+            if name is None:
+                # Belongs to some other window (or not mapped at all)
                 continue
-            except ValueError:
-                # Index error
+            del self._appmap_changes[acc]
+            if renamed:
+                # Rebuild the renamed object from its parent
+                name = appmap[name]['parent']
+                if name not in appmap:
+                    # Window title changed, the window key is stale
+                    return False
+            dirty[name] = True
+        # Coalesce, skip subtrees which are part of a dirty ancestor
+        for name in list(dirty.keys()):
+            parent = appmap[name]['parent']
+            while parent in appmap:
+                if parent in dirty:
+                    del dirty[name]
+                    break
+                parent = appmap[parent]['parent']
+        for name in dirty:
+            try:
+                self._patch_appmap(appmap, name)
+            except:
+                if self._ldtp_debug:
+                    print(traceback.format_exc())
+                return False
+        if dirty:
+            # Grown / shrunk in place
+            self._appmap.remeasure(appmap)
+        return True
+
+    def _patch_appmap(self, appmap, name):
+        """
+        Recrawl the children of the given appmap entry, LDTP names of the
+        objects outside the subtree are retained
+        """
+        acc = appmap.accessible(name)
+        if not acc:
+            raise LdtpServerException('Unable to find object "%s"' % name)
+        # Objects still present keep their names, only the added ones
+        # advance the window wide counters
+        patched_names = {}
+        stack = appmap.children_of(name)
+        while stack:
+            child = stack.pop()
+            stack.extend(appmap.children_of(child))
+            child_acc = appmap.accessible(child)
+            if child_acc is None:
                 continue
+            try:
+                patched_names[child_acc] = appmap[child]
+            except TypeError:
+                # Unhashable accessible, named afresh
+                pass
+        appmap.remove_subtree(name)
+        self.ldtpized_list = appmap
+        self.ldtpized_obj_index = appmap.obj_index
+        self._patched_names = patched_names
+        try:
+            self._populate_appmap_children(acc, name)
+        finally:
+            self._patched_names = None
+
+    def _patched_object_name(self, node):
+        """
+        Get the LDTP name and object index the object had before its
+        subtree got patched
+
+        @return: LDTP name and object index, None if the object is new
+        or its role / name changed
+        @rtype: tuple
+        """
+        try:
+            entry = self._patched_names.pop(node.acc, None)
+        except TypeError:
+            return None
+        if entry is None or entry['class'] != node.role_name or \
+                entry['label'] != node.name or \
+                entry['key'] in self.ldtpized_list:
+            return None
+        return entry['key'], entry['obj_index']
 
     def _on_window_event(self, event):
         if self._ldtp_debug:
@@ -276,55 +486,103 @@ class Utils:
                 # ignore exception, as we just use them for debugging
                 pass
         try:
-            # Proceed only for window destry and deactivate event
-            if event and (event.type == "window:destroy" or \
-                              event.type == "window:deactivate") and \
-                              event.source:
-                abbrev_role, abbrev_name, label_by = self._ldtpize_accessible( \
-                    event.source)
-                # LDTPized name
-                try:
-                    win_name = '%s%s' % (abbrev_role, abbrev_name)
-                except UnicodeDecodeError:
-                    win_name = '%s%s' % (abbrev_role, abbrev_name.decode('utf-8'))
-                # Window title is empty
-                if abbrev_name == '':
-                    for win_name in self._appmap.keys():
-                        # When window doesn't have a title, destroy all the
-                        # window info from appmap, which doesn't haven't title
-                        if re.search('%s\d*$' % abbrev_role, win_name, re.M | re.U):
-                            del self._appmap[win_name]
-                else:
-                    for name in self._appmap.keys():
-                        # When multiple window have same title, destroy all the
-                        # window info from appmap, which have same title
-                        if re.search('%s%s\d*$' % (abbrev_role, abbrev_name),
-                                     win_name, re.M | re.U) or \
-                                     re.search('%s%s*$' % (abbrev_role, abbrev_name),
-                                               win_name, re.M | re.U):
-                                     del self._appmap[name]
+            if not event:
                 return
-            cache = True
-            if not self.cached_apps:
-                # If not initialized as list, don't process further
+            # Memoized properties of the window / probe misses in the
+            # windows of the application and of absent windows might
+            # have changed
+            property_memo.forget(event.source)
+            negative_cache.invalidate(event.host_application, True)
+            Utils.window_event_stats['received'] += 1
+            # Application activity, for the idle waits
+            self.app_table.touch(event.host_application)
+            # Busy desktops send bursts of window events (tooltips,
+            # popups, focus changes), queue them, coalesced per source
+            try:
+                pending = self._window_events.get(event.source)
+                if pending is None:
+                    pending = self._window_events[event.source] = \
+                        [event.source, set(), event.host_application]
+            except TypeError:
+                # Unhashable accessible, can't be coalesced
+                self._apply_window_event(event.source, set([event.type]),
+                                         event.host_application)
                 return
-            for app in self.cached_apps:
-                if event.host_application == app[0]:
-                    # Application already in cached list
-                    cache = False
-                    # Force remap for this application, as some object is
-                    # either added / removed / changed
-                    index = self.cached_apps.index(app)
-                    self.cached_apps[index][1] = True
-                    if hasattr(app, 'setCacheMask'):
-                        app.setCacheMask(pyatspi.cache.ALL)
-                    break
-            if cache:
-                # If app doesn't exist in cached apps, then add it
-                # adding app and True flag as list - This flag indicates that the
+            pending[1].add(event.type)
+            if len(self._window_events) > MAX_PENDING_WINDOW_EVENTS:
+                self._apply_window_events()
+            elif self._window_event_timer is None:
+                self._window_event_timer = gobject.timeout_add(
+                    WINDOW_EVENT_BATCH_MS, self._window_event_timeout_cb)
+        except:
+            if self._ldtp_debug:
+                print(traceback.format_exc())
+            if self._ldtp_debug_file:
+                with open(self._ldtp_debug_file, "a") as fp:
+                    fp.write(traceback.format_exc())
+
+    def _window_event_timeout_cb(self):
+        self._window_event_timer = None
+        self._apply_window_events()
+        # Don't repeat, scheduled again by the next event
+        return False
+
+    def _apply_window_events(self):
+        """
+        Apply the queued window events, called before the window registry
+        / cached appmaps are used, so that lookups never see them late
+        """
+        if not self._window_events:
+            return
+        if self._window_event_timer is not None:
+            gobject.source_remove(self._window_event_timer)
+            self._window_event_timer = None
+        pending = list(self._window_events.values())
+        self._window_events.clear()
+        for source, event_types, app in pending:
+            self._apply_window_event(source, event_types, app)
+        Utils.window_event_stats['applied'] += len(pending)
+        Utils.window_event_stats['batches'] += 1
+
+    def _apply_window_event(self, source, event_types, app):
+        """
+        Apply the window events of one source
+
+        @param source: Window handle
+        @type source: object
+        @param event_types: Types of the events received from the source
+        @type event_types: set
+        @param app: Application handle
+        @type app: object
+        """
+        try:
+            if source:
+                self._update_window_registry(source, event_types)
+            # Proceed only for window destry and deactivate event
+            if source and ('window:destroy' in event_types or \
+                               'window:deactivate' in event_types):
+                # Evict just the appmaps cached for this window
+                self._appmap.evict(source)
+                self._drop_partial_crawls(source)
+                if not event_types - set(['window:destroy',
+                                          'window:deactivate']):
+                    return
+            if self.app_table is None:
+                # If not initialized, don't process further
+                return
+            record = self.app_table.get(app)
+            if record is None:
+                # If app doesn't exist in app table, then add it
+                # with remap flag set - This flag indicates that the
                 # object in application either got added / removed
                 # so remap should be forced
-                self.cached_apps.append([event.host_application, True])
+                self.app_table.add(app)
+            elif not self.incremental_appmap:
+                # Force remap for this application, as some object is
+                # either added / removed / changed. With incremental
+                # appmap, changes are tracked by _obj_changed
+                record.remap = True
+                self._set_cache_mask(record)
         except:
             if self._ldtp_debug:
                 print(traceback.format_exc())
@@ -332,32 +590,118 @@ class Utils:
                 with open(self._ldtp_debug_file, "a") as fp:
                     fp.write(traceback.format_exc())
 
-    def _atspi2_workaround(self):
+    def _update_window_registry(self, source, event_types):
+        """
+        Add created windows to the window registry, remove destroyed ones
+        """
+        if not self.window_registry or not self.window_registry.scanned:
+            # Populated on first window lookup
+            return
+        if 'window:destroy' in event_types:
+            self.window_registry.remove(source)
+        elif 'window:create' in event_types:
+            self._register_window(source)
+
+    def _rename_window(self, acc):
+        """
+        Register the window again with its new title, if the renamed
+        accessible is a registered window
+        """
+        if not self.window_registry or \
+                not self.window_registry.name_of(acc):
+            return
+        self.window_registry.remove(acc)
+        try:
+            self._register_window(acc)
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            # for the windows which no longer exist
+            if self._ldtp_debug:
+                print(traceback.format_exc())
+
+    def _register_window(self, gui):
+        """
+        Add window to the window registry
+
+        @param gui: Window handle
+        @type gui: object
+
+        @return: window name in LDTP format
+        @rtype: string
+        """
+        abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(gui)
+        try:
+            title = property_memo.name(gui)
+        except:
+            title = ''
+        try:
+            is_window = property_memo.role(gui) in window_roles
+        except:
+            is_window = False
+        return self.window_registry.add(gui, title, abbrev_role, abbrev_name,
+                                        label_by, is_window)
+
+    def _rescan_windows(self):
+        """
+        Populate the window registry from all the open windows
+        """
+        registry = self.window_registry
+        registry.clear()
+        # Resync the application list as well, the window might belong
+        # to an application which didn't send any window event yet
+        self._atspi2_workaround(True)
+        for gui in self._list_guis():
+            if not gui:
+                continue
+            self._register_window(gui)
+        registry.scanned = True
+        registry.rescans += 1
+
+    def _list_window_names(self):
+        """
+        List LDTP names of all the open windows
+        """
+        self._apply_window_events()
+        if not self.window_registry.scanned:
+            self._rescan_windows()
+        return self.window_registry.names()
+
+    def _atspi2_workaround(self, force=False):
         if not hasattr(pyatspi, 'Accessible'):
             # This exist only in pyatspi2
             # Don't do the work around
             return
         self._atspi2_ver = True
+        if not force and not self.app_table.resync_due():
+            # Application list is resynced at most once per
+            # RESYNC_INTERVAL, window events keep it current in between
+            return
+        # Work around for at-spi2, new applications doesn't always
+        # send window events
+        apps = []
         for app in self._desktop:
-            # Work around for at-spi2
             if not app: continue
-            flag = False
-            for tmpapp in self.cached_apps:
-                if app == tmpapp[0]:
-                    flag = True
-                    break
-            if hasattr(app, 'setCacheMask'):
-                app.setCacheMask(pyatspi.cache.ALL)
-            # App already in list, don't add again
-            if flag: continue
-            self.cached_apps.append([app, True])
+            apps.append(app)
+        self.app_table.resync(apps)
+        for record in self.app_table.records():
+            self._set_cache_mask(record)
+
+    def _set_cache_mask(self, record):
+        """
+        Set cache mask on the application, once
+        """
+        if record.cache_mask == pyatspi.cache.ALL or \
+                not hasattr(record.app, 'setCacheMask'):
+            return
+        record.app.setCacheMask(pyatspi.cache.ALL)
+        record.cache_mask = pyatspi.cache.ALL
 
     def _list_apps(self):
         """
         List all the applications
         """
         self._atspi2_workaround()
-        for app in self.cached_apps:
+        for app in self.app_table.apps():
             if not app: continue
             yield app
 
@@ -366,21 +710,25 @@ class Utils:
         List all the windows that are currently open
         """
         self._atspi2_workaround()
-        for app in self.cached_apps:
-            if not app or not app[0]: continue
-            try:
-                # application handle will be in app[0]
-                # app[1] will hold, whether remap should be done or not
-                for gui in app[0]:
-                    if not gui: continue
-                    yield gui
-            except LookupError:
-                # If the window doesn't exist, remove from the cached list
-                self.cached_apps.remove(app)
-            except:
-                # In at-spi2 gi._glib.GError exception is thrown
-                # If the window doesn't exist, remove from the cached list
-                self.cached_apps.remove(app)
+        for app in self.app_table.apps():
+            if not app: continue
+            children = iter(app)
+            while True:
+                # Just the at-spi calls are guarded, an exception raised
+                # in the consumer (or closing this generator) must not
+                # drop the application
+                try:
+                    gui = next(children)
+                except StopIteration:
+                    break
+                except:
+                    # LookupError / in at-spi2 gi._glib.GError exception
+                    # is thrown. If the application doesn't exist,
+                    # remove from the app table
+                    self.app_table.remove(app)
+                    break
+                if not gui: continue
+                yield gui
 
     def _get_geometry(self):
         """
@@ -402,7 +750,53 @@ class Utils:
                         associated label
         @rtype: tuple
         """
-        label_by = label_acc = None
+        label_by = None
+        label_acc = self._get_label_accessible(acc)
+        try:
+            role = property_memo.role(acc)
+        except:
+            # with at-spi2 noticed gi._glib.GError exception
+            role = None
+        if role in window_roles:
+            # Strip space and new line from window title
+            strip = WINDOW_STRIP
+        else:
+            # Strip space, colon, dot, underscore and new line from
+            # all other object types
+            strip = OBJECT_STRIP
+        if label_acc:
+            try:
+                # Priority to associated label
+                label_by = property_memo.name(label_acc)
+            except:
+                label_by = ''
+        # Return the role type (if, not in the know list of roles,
+        # return ukn - unknown), strip the above characters from name
+        # also return labely_by string
+        try:
+            label = pattern_cache.strip(property_memo.name(label_acc or acc),
+                                        strip)
+        except:
+            label = ''
+        return abbreviated_roles.get(role, 'ukn'), \
+            label, \
+            label_by
+
+    def _get_label_accessible(self, acc):
+        """
+        Get the accessible labelling the given accessible
+
+        @param acc: Accessible handle
+        @type acc: object
+
+        @return: labelled by / controlled by target, None if there is none
+        @rtype: object
+        """
+        return property_memo.get(acc, 'label', self._fetch_label_accessible,
+                                 acc)
+
+    def _fetch_label_accessible(self, acc):
+        label_acc = None
         try:
             # Get accessible relation set
             rel_set = acc.getRelationSet()
@@ -432,54 +826,21 @@ class Utils:
                             with open(self._ldtp_debug_file, "a") as fp:
                                 fp.write(traceback.format_exc())
                         continue
-        try:
-            role = acc.getRole()
-        except:
-            # with at-spi2 noticed gi._glib.GError exception
-            role = None
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
-            # Strip space and new line from window title
-            strip = '( |\n)'
-        else:
-            # Strip space, colon, dot, underscore and new line from
-            # all other object types
-            strip = '( |:|\.|_|\n)'
-        if label_acc:
-            try:
-                # Priority to associated label
-                label_by = label_acc.name
-            except:
-                label_by = ''
-        # Return the role type (if, not in the know list of roles,
-        # return ukn - unknown), strip the above characters from name
-        # also return labely_by string
-        try:
-            label = re.sub(strip, '', (label_acc or acc).name)
-        except:
-            label = ''
-        return abbreviated_roles.get(role, 'ukn'), \
-            label, \
-            label_by
+        return label_acc
 
     def _glob_match(self, pattern, string):
         """
         Match given string, by escaping regex characters
         """
-        # regex flags Multi-line, Unicode, Locale
-        return bool(re_match(glob_trans(pattern), string,
-                             re.M | re.U | re.L))
+        # Compiled locator is cached, see matcher.Locator
+        return pattern_cache.locator(pattern).match(string)
 
     def _match_name_to_acc(self, name, acc, classType = None):
         """
         Match given name with acc.name / acc.associate name
         and also class type
 
-        @param name: Label to be matched
+        @param name: Label to be matched, or its compiled locator
         @type name: string
         @param acc: Accessibility handle
         @type acc: object
@@ -491,6 +852,7 @@ class Utils:
         """
         if not acc or not name:
             return 0
+        locator = pattern_cache.locator(name)
         try:
             if classType:
                 # Accessibility role type returns space, when multiple
@@ -498,18 +860,19 @@ class Utils:
                 # User might mistype with multiple space, to avoid
                 # any confusion, using _. So, user will be inputing
                 # push_button
-                roleName = acc.getRoleName().replace(' ', '_')
+                roleName = property_memo.role_name(acc).replace(' ', '_')
             else:
                 roleName = None
             if roleName != classType:
                 # If type doesn't match, don't proceed further
                 return 0
-            if acc.name:
+            acc_name = property_memo.name(acc)
+            if acc_name:
                 try:
-                    _acc_name="%s" % acc.name
+                    _acc_name="%s" % acc_name
                 except UnicodeDecodeError:
-                    _acc_name=acc.name.decode('utf-8')
-            if acc.name and re.match(fnmatch.translate(name), _acc_name, re.M | re.U):
+                    _acc_name=acc_name.decode('utf-8')
+            if acc_name and locator.match_unicode(_acc_name):
                 # Since, type already matched and now the given name
                 # and accessibile name matched, mission accomplished
                 return 1
@@ -527,35 +890,30 @@ class Utils:
         except UnicodeDecodeError:
            _object_name = '%s%s' % (_ldtpize_accessible_name[0],
                                      _ldtpize_accessible_name[1].decode('utf-8'))
-        if self._glob_match(name, acc.name):
+        if locator.match(property_memo.name(acc)):
             # If given name match object name with regexp
             return 1
-        if self._glob_match(name, _object_name):
+        if locator.match(_object_name):
             # If given name match LDTPized name format with regexp
             return 1
         try:
-            role = acc.getRole()
+            role = property_memo.role(acc)
         except:
             # In at-spi2 acc doesn't exist
             # which raises exception gi._glib.GError
             return 0
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
+        if role in window_roles:
             # If window type, strip using this format
-            strip = '( |\n)'
+            strip = WINDOW_STRIP
         else:
             # If any other type, strip using this format
-            strip = '( |:|\.|_|\n)'
+            strip = OBJECT_STRIP
         # Strip given name too, as per window type or other type
-        _tmp_name = re.sub(strip, '', name)
-        if self._glob_match(_tmp_name, _object_name):
+        _tmp_name = locator.stripped(strip)
+        if _tmp_name.match(_object_name):
             # Match stripped given name and LDTPized name
             return 1
-        if self._glob_match(_tmp_name, _ldtpize_accessible_name[1]):
+        if _tmp_name.match(_ldtpize_accessible_name[1]):
             # Match stripped given name and LDTPized name, without object type
             # ex: UnsavedDocument1-gedit, without frm at start
             return 1
@@ -577,37 +935,29 @@ class Utils:
         is_obj_type=self._match_obj_type(acc['class'], obj_type)
         if not is_obj_type:
             return 0
-        if self._glob_match(name, acc['key']):
+        # Compiled once per query, see matcher.Locator
+        locator = pattern_cache.locator(name)
+        if locator.match(acc['key']):
             return 1
-        if self._glob_match(name, acc['obj_index']):
+        if locator.match(acc['obj_index']):
             return 1
-        if self._glob_match(name, acc['label_by']):
+        if locator.match(acc['label_by']):
             return 1
-        if self._glob_match(name, acc['label']):
+        if locator.match(acc['label']):
             return 1
         # Strip space and look for object
-        obj_name = '%s' % re.sub(' ', '', name)
-        role = acc['class']
-        if role == 'frame' or role == 'dialog' or \
-                role == 'window' or \
-                role == 'font_chooser' or \
-                role == 'file_chooser' or \
-                role == 'alert' or \
-                role == 'color_chooser':
-            strip = '( |\n)'
-        else:
-            strip = '( |:|\.|_|\n)'
-        obj_name = re.sub(strip, '', name)
+        strip = strip_for_class(acc['class'])
+        obj_name = locator.stripped(strip)
+        if obj_name.match(acc['key']):
+            return 1
         if acc['label_by']:
-            _tmp_name = re.sub(strip, '', acc['label_by'])
-            if self._glob_match(obj_name, _tmp_name):
+            _tmp_name = pattern_cache.strip(acc['label_by'], strip)
+            if obj_name.match(_tmp_name):
                 return 1
         if acc['label']:
-            _tmp_name = re.sub(strip, '', acc['label'])
-            if self._glob_match(obj_name, _tmp_name):
+            _tmp_name = pattern_cache.strip(acc['label'], strip)
+            if obj_name.match(_tmp_name):
                 return 1
-        if self._glob_match(obj_name, acc['key']):
-            return 1
         return 0
 
     def _list_objects(self, obj):
@@ -615,13 +965,13 @@ class Utils:
             yield obj
             for child in obj:
                 if not self._handle_table_cell and \
-                        child.getRole() == pyatspi.ROLE_TABLE_CELL:
+                        property_memo.role(child) == pyatspi.ROLE_TABLE_CELL:
                     # In OO.o navigating table cells consumes more time
                     # resource
                     break
                 for c in self._list_objects(child):
                     # Don't include separators in the list
-                    if c.getRole() != pyatspi.ROLE_SEPARATOR:
+                    if property_memo.role(c) != pyatspi.ROLE_SEPARATOR:
                         yield c
 
     def _get_combo_child_object_type(self, obj):
@@ -638,9 +988,10 @@ class Utils:
                 child_obj = self._get_combo_child_object_type(child)
                 if child_obj:
                     return child_obj
-            if child.getRole() == pyatspi.ROLE_LIST:
+            role = property_memo.role(child)
+            if role == pyatspi.ROLE_LIST:
                 return child
-            elif child.getRole() == pyatspi.ROLE_MENU:
+            elif role == pyatspi.ROLE_MENU:
                 return child
 
     def _get_child_object_type(self, obj, role_type):
@@ -657,17 +1008,52 @@ class Utils:
                 child_obj = self._get_child_object_type(child, role_type)
                 if child_obj:
                     return child_obj
-            if child.getRole() == role_type:
+            if property_memo.role(child) == role_type:
                 return child
 
-    def _add_appmap_data(self, obj, parent, child_index):
-        if not obj:
+    def _add_appmap_data(self, node, parent, child_index, crawler):
+        if not node:
             return None
-        abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(obj)
+        abbrev_role = node.abbrev_role
+        abbrev_name = node.label
+        label_by = node.label_by
+        patched = None
+        if self._patched_names and not self.stable_names:
+            patched = self._patched_object_name(node)
+        if patched:
+            ldtpized_name, obj_index = patched
+        else:
+            ldtpized_name, obj_index = self._new_object_name(
+                parent, abbrev_role, abbrev_name)
+        if not label_by:
+            label_by = ''
+        if node.role in window_roles:
+            obj_index = '%s#%d' % (crawler.get_app_name(node.acc),
+                                   child_index)
+        self.ldtpized_list[ldtpized_name] = AppmapEntry(ldtpized_name,
+                                                        parent,
+                                                        node.role_name,
+                                                        child_index,
+                                                        obj_index,
+                                                        node.name,
+                                                        label_by,
+                                                        node.description,
+                                                        node.key_binding)
+        self.ldtpized_list.add_child(parent, ldtpized_name)
+        self.ldtpized_list.bind(ldtpized_name, node.acc)
+        return ldtpized_name
+
+    def _new_object_name(self, parent, abbrev_role, abbrev_name):
+        """
+        Get LDTP name and object index of an object added to the appmap,
+        advancing the window wide counter of its role
+        """
         if abbrev_role in self.ldtpized_obj_index:
             self.ldtpized_obj_index[abbrev_role] += 1
         else:
             self.ldtpized_obj_index[abbrev_role] = 0
+        if self.stable_names:
+            return self._stable_object_name(parent, abbrev_role, abbrev_name)
         if abbrev_name == '':
             ldtpized_name_base = abbrev_role
             ldtpized_name = '%s%d' % (ldtpized_name_base,
@@ -679,108 +1065,370 @@ class Utils:
         while ldtpized_name in self.ldtpized_list:
             i += 1
             ldtpized_name = '%s%d' % (ldtpized_name_base, i)
-        if parent in self.ldtpized_list:
-            _current_children = self.ldtpized_list[parent]['children']
-            if _current_children:
-                _current_children = '%s %s' % (_current_children, ldtpized_name)
-            else:
-                _current_children = ldtpized_name
-            self.ldtpized_list[parent]['children'] = _current_children
-        if not label_by:
-            label_by = ''
-        key_binding = ''
-        try:
-            iaction = obj.queryAction()
-            for j in xrange(iaction.nActions):
-                if iaction.getKeyBinding(j) != '':
-                    key_binding = iaction.getKeyBinding(j)
-                    break
-        except NotImplementedError:
-            pass
-        role = obj.getRole()
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
-            obj_index = '%s#%d' % (obj.getApplication().name,
-                                   obj.getIndexInParent())
+        return ldtpized_name, '%s#%d' % (abbrev_role,
+                                         self.ldtpized_obj_index[abbrev_role])
+
+    def _stable_object_name(self, parent, abbrev_role, abbrev_name):
+        """
+        Get LDTP name and object index derived from the parent name and
+        the position among the siblings of the same role, which change
+        only when an object of that role is added / removed before it
+        in the same parent
+
+        @param parent: LDTP name of the parent
+        @type parent: string
+        @param abbrev_role: Abbreviated role
+        @type abbrev_role: string
+        @param abbrev_name: Stripped name, empty if unnamed
+        @type abbrev_name: string
+
+        @return: LDTP name, object index
+        @rtype: tuple
+        """
+        counters = self.ldtpized_list.sibling_index.setdefault(parent, {})
+        sibling = counters.get(abbrev_role, -1) + 1
+        counters[abbrev_role] = sibling
+        # Path fingerprint, the parent name is stable as well
+        path = fingerprint([parent, abbrev_role, sibling])[:8]
+        if abbrev_name == '':
+            ldtpized_name_base = ldtpized_name = '%s%s' % (abbrev_role, path)
         else:
-            obj_index = '%s#%d' % (abbrev_role,
-                                   self.ldtpized_obj_index[abbrev_role])
-        self.ldtpized_list[ldtpized_name] = {'key' : ldtpized_name,
-                                             'parent' : parent,
-                                             'class' : obj.getRoleName().replace(' ', '_'),
-                                             'child_index' : child_index,
-                                             'children' : '',
-                                             'obj_index' : obj_index,
-                                             'label' : obj.name,
-                                             'label_by' : label_by,
-                                             'description' : obj.description,
-                                             'key_binding' : key_binding
-                                             }
-        return ldtpized_name
+            ldtpized_name_base = '%s%s' % (abbrev_role, abbrev_name)
+            ldtpized_name = ldtpized_name_base
+            if ldtpized_name in self.ldtpized_list:
+                # Duplicate name, the first one crawled keeps it as is
+                ldtpized_name_base = ldtpized_name = '%s%s' % \
+                    (ldtpized_name_base, path)
+        i = 0
+        while ldtpized_name in self.ldtpized_list:
+            # Fingerprint collision
+            i += 1
+            ldtpized_name = '%s%d' % (ldtpized_name_base, i)
+        return ldtpized_name, '%s#%s' % (abbrev_role, path)
 
     def _populate_appmap(self, obj, parent, child_index):
-        index = -1
         if obj:
-            if child_index != -1:
-                parent = self._add_appmap_data(obj, parent, child_index)
-            # Have noticed using obj.getIndexInParent()
-            # returns -1, let the loop counts the child index
-            for child in obj:
-                index += 1
-                if not child:
-                    continue
-                try:
-                    if not self._handle_table_cell and \
-                           child.getRole() == pyatspi.ROLE_TABLE_CELL:
-                        break
-                except:
-                    # Some object bailed out
-                    continue
-                self._populate_appmap(child, parent, index)
+            crawler = Crawler(self)
+            node = crawler.fetch(obj, child_index, self.crawl_pool)
+            self._add_appmap_nodes(node, parent, crawler, child_index != -1)
+
+    def _populate_appmap_children(self, obj, parent):
+        crawler = Crawler(self)
+        node = crawler.fetch(obj)
+        self._add_appmap_nodes(node, parent, crawler, False)
+
+    def _add_appmap_nodes(self, node, parent, crawler, add_root=True):
+        """
+        Add the prefetched subtree to the appmap, depth first, so that
+        the LDTP names match the order of a recursive crawl
+        """
+        stack = [(node, parent, add_root)]
+        while stack:
+            node, parent, add = stack.pop()
+            if add:
+                parent = self._add_appmap_data(node, parent, node.index,
+                                               crawler)
+            for child in reversed(node.children):
+                stack.append((child, parent, True))
 
     def _appmap_pairs(self, gui, window_name, force_remap = False):
-        self.ldtpized_list = {}
-        self.ldtpized_obj_index = {}
+        crawl = None
         if not force_remap:
-            self._atspi2_workaround()
-            for app in self.cached_apps:
-                try:
-                    if app[0] and gui and app[0] == gui.parent and \
-                            app[1] == True:
-                        # Means force_remap
-                        force_remap = True
-                        index = self.cached_apps.index(app)
-                        if index != -1:
-                            # Reset force_remap to False
-                            self.cached_apps[index][1] = False
-                        break
-                except NameError:
-                    continue
-            # If force_remap set in the above condition, skip the
-            # following lookup and do force remap
-            if not force_remap:
-                for key in self._appmap.keys():
-                    if self._match_name_to_acc(key, gui):
-                        return self._appmap[key]
-
-        if gui and gui.parent:
-            abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(gui.parent)
-            _parent = abbrev_name
+            appmap = self._cached_appmap(gui, window_name)
+            if appmap is not None:
+                return appmap
+            crawl = self._get_partial_crawl(gui, window_name)
         else:
-            _parent = ''
+            self._partial_crawls.pop(window_name, None)
+        if crawl:
+            # Resume the crawl stopped by an earlier object lookup
+            del self._partial_crawls[window_name]
+            Utils.lazy_crawl_stats['resumed'] += 1
+            try:
+                appmap = crawl.finish()
+            except LookupError:
+                raise LdtpServerException("Unable to find window/object")
+            return self._install_appmap(gui, window_name, appmap,
+                                        crawl.obj_index)
+        self.ldtpized_list = Appmap()
+        self.ldtpized_obj_index = {}
+        try:
+            self._populate_appmap(gui, self._get_window_parent_name(gui),
+                                  gui.getIndexInParent())
+        except LookupError:
+            raise LdtpServerException("Unable to find window/object")
+        return self._install_appmap(gui, window_name, self.ldtpized_list,
+                                    self.ldtpized_obj_index)
+
+    def _remap_windows(self, windows):
+        """
+        Crawl the windows concurrently, on the crawl pool. Objects are
+        named after all the windows are fetched, one window at a time
+
+        @param windows: Window handle and window name in appmap format
+        @type windows: list
+        """
+        def fetch(window):
+            gui, window_name = window
+            crawler = Crawler(self)
+            return crawler, crawler.fetch(gui, gui.getIndexInParent())
         try:
-            self._populate_appmap(gui, _parent, gui.getIndexInParent())
+            fetched = self.crawl_pool.map(fetch, windows)
         except LookupError:
             raise LdtpServerException("Unable to find window/object")
-        self._appmap[window_name] = self.ldtpized_list
-        return self.ldtpized_list
+        for (gui, window_name), (crawler, node) in zip(windows, fetched):
+            self._partial_crawls.pop(window_name, None)
+            self.ldtpized_list = Appmap()
+            self.ldtpized_obj_index = {}
+            self._add_appmap_nodes(node, self._get_window_parent_name(gui),
+                                   crawler, node.index != -1)
+            self._install_appmap(gui, window_name, self.ldtpized_list,
+                                 self.ldtpized_obj_index)
+
+    def _cached_appmap(self, gui, window_name):
+        """
+        Get the cached appmap of the window, patched with the queued
+        changes
+
+        @param gui: Window handle
+        @type gui: object
+        @param window_name: Window name in appmap format
+        @type window_name: string
+
+        @return: appmap, None if the window has to be crawled
+        @rtype: object
+        """
+        self._apply_window_events()
+        self._atspi2_workaround()
+        # Application objects got added / removed, the flag is reset
+        remap = gui and self.app_table.take_remap(gui.parent)
+        appmap = self._appmap.find(gui, window_name)
+        if appmap is None:
+            # First lookup of the window since the daemon started
+            appmap = self._load_appmap_snapshot(gui, window_name)
+            if appmap is not None:
+                self._appmap[window_name] = appmap
+            return appmap
+        if remap:
+            # Force remap
+            self._partial_crawls.pop(window_name, None)
+            return None
+        if self._apply_appmap_changes(appmap):
+            return appmap
+        # Patching failed, remap the window
+        self._appmap.stale_recoveries += 1
+        return None
+
+    def _window_app(self, window_name):
+        """
+        Get the application of the window, to tag the negative cache
+        entries of the probes in the window. The window the probe just
+        looked up is used, without looking it up again
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+
+        @return: application handle, None if the window wasn't found
+        @rtype: object
+        """
+        last_window_name, gui = self._last_window
+        try:
+            if last_window_name != window_name:
+                gui, _window_name = \
+                    self._internal_get_window_handle(window_name)
+            if gui:
+                return gui.parent
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            pass
+        return None
+
+    def _get_window_parent_name(self, gui):
+        if gui and gui.parent:
+            abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(gui.parent)
+            return abbrev_name
+        return ''
+
+    def _install_appmap(self, gui, window_name, appmap, obj_index):
+        """
+        Cache the freshly crawled appmap of the window
+        """
+        appmap.obj_index = obj_index
+        appmap.window = gui
+        # Changes queued for the freshly crawled objects are obsolete
+        for acc in list(self._appmap_changes.keys()):
+            if appmap.name_of(acc) is not None:
+                del self._appmap_changes[acc]
+        self._appmap[window_name] = appmap
+        self._save_appmap_snapshot(gui, window_name, appmap)
+        return appmap
+
+    def _get_partial_crawl(self, gui, window_name):
+        crawl = self._partial_crawls.get(window_name)
+        if crawl and crawl.window != gui:
+            # Some other window had the same name earlier
+            del self._partial_crawls[window_name]
+            return None
+        return crawl
+
+    def _drop_partial_crawls(self, gui):
+        for window_name, crawl in list(self._partial_crawls.items()):
+            if crawl.window == gui:
+                del self._partial_crawls[window_name]
+
+    def _lazy_get_object(self, gui, window_name, obj_name, obj_type=[]):
+        """
+        Crawl the window just until the object is found, the crawl is
+        resumed by the next lookup / full map of the window
+
+        @param gui: Window handle
+        @type gui: object
+        @param window_name: Window name in appmap format
+        @type window_name: string
+        @param obj_name: Object name
+        @type obj_name: string
+        @param obj_type: Restrict to these appmap classes, [] for any
+        @type obj_type: list
+
+        @return: accessible handle on success, else None and the
+        appmap of the completed crawl
+        @rtype: tuple
+        """
+        # Matched against every crawled entry, compile once
+        obj_name = pattern_cache.locator(obj_name)
+        crawl = self._get_partial_crawl(gui, window_name)
+        if crawl:
+            # Objects crawled by an earlier lookup
+            if obj_name.glob:
+                names = list(crawl.appmap.keys())
+            elif obj_name.name in crawl.appmap:
+                names = [obj_name.name]
+            else:
+                names = []
+            for name in names:
+                entry = crawl.appmap[name]
+                if not self._is_crawled_object(entry, obj_name, obj_type):
+                    continue
+                acc = self._get_resolved_accessible(crawl.appmap, entry)
+                if acc:
+                    return acc, None
+                # Crawled part is stale
+                del self._partial_crawls[window_name]
+                crawl = None
+                break
+        if not crawl:
+            try:
+                crawl = LazyCrawl(self, Appmap(), gui,
+                                  self._get_window_parent_name(gui),
+                                  gui.getIndexInParent())
+            except LookupError:
+                raise LdtpServerException("Unable to find window/object")
+            self._partial_crawls[window_name] = crawl
+        while not crawl.done():
+            name = crawl.next()
+            if name is None:
+                continue
+            if self._is_crawled_object(crawl.appmap[name], obj_name,
+                                       obj_type):
+                Utils.lazy_crawl_stats['early_stops'] += 1
+                return crawl.appmap.accessible(name), None
+        del self._partial_crawls[window_name]
+        Utils.lazy_crawl_stats['completed'] += 1
+        appmap = crawl.finish()
+        return None, self._install_appmap(gui, window_name, appmap,
+                                          crawl.obj_index)
+
+    def _is_crawled_object(self, entry, obj_name, obj_type=[]):
+        """
+        Check whether the lazy crawl can stop at this entry, that is
+        the lookup in the full appmap would return the same entry
+
+        @return: True on match, else False
+        @rtype: boolean
+        """
+        if not self._match_obj_type(entry.class_name, obj_type):
+            return False
+        obj_name = pattern_cache.locator(obj_name)
+        if obj_name.glob:
+            # Glob matches the first entry found, in any order
+            return bool(self._match_name_to_appmap(obj_name, entry,
+                                                   obj_type))
+        # Object names are unique. Other exact matches have to wait for
+        # the full map, as a label_by match of some later object takes
+        # priority over a label match
+        return entry.key == obj_name.name
+
+    def _probe_window(self, gui):
+        """
+        Get application name and structural fingerprint of the window:
+        role and name of the window, role and child count of its
+        children. Just a few round trips, compared to the crawl
+
+        @param gui: Window handle
+        @type gui: object
+
+        @return: application name, fingerprint
+        @rtype: tuple
+        """
+        # Names differ with the naming scheme, so does the snapshot
+        probe = [self.stable_names, gui.getRoleName(), gui.name]
+        for child in gui:
+            if not child:
+                probe.append('')
+                continue
+            probe.extend([child.getRoleName(), child.childCount])
+        return gui.parent.name, fingerprint(probe)
+
+    def _load_appmap_snapshot(self, gui, window_name):
+        """
+        Load the appmap saved for the window, if the window structure
+        didn't change since
+
+        @return: appmap on success, else None
+        @rtype: object
+        """
+        if not self.appmap_snapshots or not gui:
+            return None
+        try:
+            app_name, window_fingerprint = self._probe_window(gui)
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            return None
+        appmap = self.appmap_snapshots.load(app_name, window_name,
+                                            window_fingerprint)
+        if appmap is None:
+            return None
+        appmap.window = gui
+        appmap.from_snapshot = True
+        appmap.bind(appmap.root(), gui)
+        return appmap
+
+    def _save_appmap_snapshot(self, gui, window_name, appmap):
+        if not self.appmap_snapshots or not gui:
+            return
+        try:
+            app_name, window_fingerprint = self._probe_window(gui)
+            self.appmap_snapshots.save(app_name, window_name,
+                                       window_fingerprint, appmap)
+        except:
+            # Snapshot is just an optimization, don't fail the command
+            if self._ldtp_debug:
+                print(traceback.format_exc())
+            if self._ldtp_debug_file:
+                with open(self._ldtp_debug_file, "a") as fp:
+                    fp.write(traceback.format_exc())
 
     def _get_menu_hierarchy(self, window_name, object_name,
-                            strict_hierarchy = False, wait = True):
+                            strict_hierarchy = False, wait = True,
+                            remap = True):
+        if self.object_handles.is_handle(object_name):
+            # Resolved once, walked again only when stale
+            record = self.object_handles.get(object_name)
+            if record and strict_hierarchy and ';' not in record.object_name:
+                raise LdtpServerException("Invalid menu hierarchy input")
+            return self._get_handle_object(object_name, wait,
+                                           remap = remap)
         _menu_hierarchy = re.split(';', object_name)
         if strict_hierarchy and len(_menu_hierarchy) <= 1:
             # If strict_hierarchy is set and _menu_hierarchy doesn't have
@@ -791,15 +1439,18 @@ class Utils:
         if not re.search('^mnu', _menu_hierarchy[0], re.M | re.U):
             # Add mnu to the first object, if it doesn't exist
             _menu_hierarchy[0] = 'mnu%s' % _menu_hierarchy[0]
-        obj = self._get_object(window_name, _menu_hierarchy[0], wait)
+        obj = self._get_object(window_name, _menu_hierarchy[0], wait,
+                               remap = remap)
         for _menu in _menu_hierarchy[1:]:
             _flag = False
+            # Matched against every menu item, compile once
+            _locator = pattern_cache.locator(_menu)
             for _child in self._list_objects(obj):
                 if obj == _child:
                     # if the given object and child object matches, as
                     # the _list_objects return object as one of the _child
                     continue
-                if self._match_name_to_acc(_menu, _child):
+                if self._match_name_to_acc(_locator, _child):
                     _flag = True
                     obj = _child
                     break
@@ -823,6 +1474,136 @@ class Utils:
                     return
             raise LdtpServerException('Object does not have a "%s" action' % action)
 
+    def _query_appmap(self, gui, window_name, appmap, role=[], name='',
+                      regex=False, state=[], ancestor='', depth=-1):
+        """
+        Find all the appmap entries matching the given predicates, the
+        cheap ones first: scope and role / name on the appmap (indexes
+        for names without wildcards), then the live states
+
+        @param gui: Window handle
+        @type gui: object
+        @param window_name: Window name in appmap format
+        @type window_name: string
+        @param appmap: application map of window
+        @type appmap: object
+        @param role: Restrict to these appmap classes, [] for any
+        @type role: list
+        @param name: Object name, glob or regex, '' for any
+        @type name: string
+        @param regex: name is a regex, searched in the LDTP name, label
+        and label_by
+        @type regex: boolean
+        @param state: States all the objects must have, eg: ['enabled']
+        @type state: list
+        @param ancestor: Restrict to the descendants of this object
+        @type ancestor: string
+        @param depth: Levels below the ancestor / window, -1 for any
+        @type depth: integer
+
+        @return: appmap entries, in crawl order
+        @rtype: list
+        """
+        states = []
+        for state_name in state:
+            state_name = state_name.upper()
+            if not state_name.startswith('STATE_'):
+                state_name = 'STATE_%s' % state_name
+            if state_name in self._states:
+                states.append(self._states[state_name])
+            elif state_name in self._states_old:
+                states.append(self._states_old[state_name])
+            else:
+                raise LdtpServerException('Unknown state "%s"' % state_name)
+        if ancestor:
+            top = self._get_object_in_window(appmap, ancestor)
+            if not top:
+                raise LdtpServerException(
+                    'Unable to find object name "%s" in application map' % \
+                        ancestor)
+            top = top['key']
+        else:
+            top = appmap.root()
+        if name and not regex:
+            # Matched against every entry in scope, compile once
+            name = pattern_cache.locator(name)
+        if name and not regex and not name.glob:
+            # Index lookup, then check each entry is in scope
+            entries = []
+            for entry in appmap.lookup_all(name.name, role):
+                level = 0
+                key = entry.key
+                while key != top and key in appmap:
+                    key = appmap[key]['parent']
+                    level += 1
+                if key != top or (ancestor and not level) or \
+                        (depth >= 0 and level > depth):
+                    continue
+                entries.append(entry)
+        else:
+            entries = []
+            if regex and name:
+                try:
+                    pattern = re.compile(name, re.M | re.U)
+                except re.error:
+                    raise LdtpServerException('Invalid regex "%s"' % name)
+            # Preorder walk of the scope, the ancestor itself excluded
+            stack = [(top, 0)]
+            while stack:
+                key, level = stack.pop()
+                entry = appmap.get(key)
+                if not entry:
+                    continue
+                if depth < 0 or level < depth:
+                    for child in reversed(appmap.children_of(key)):
+                        stack.append((child, level + 1))
+                if ancestor and not level:
+                    continue
+                if role and entry.class_name not in role:
+                    continue
+                if regex and name:
+                    if not (pattern.search(entry.key) or
+                            pattern.search(entry.label or '') or
+                            pattern.search(entry.label_by or '')):
+                        continue
+                elif name and not self._match_name_to_appmap(name, entry):
+                    continue
+                entries.append(entry)
+        if not states:
+            return entries
+        matches = []
+        for entry in entries:
+            # The appmap being queried is kept, even if some entry is stale
+            acc = self._get_entry_accessible(gui, window_name, appmap, entry,
+                                             False)
+            try:
+                current_states = acc.getState().getStates()
+            except:
+                # In at-spi2 gi._glib.GError exception is thrown
+                # for the objects which no longer exist
+                continue
+            for obj_state in states:
+                if obj_state not in current_states:
+                    break
+            else:
+                matches.append(entry)
+        return matches
+
+    def _get_entry_accessible(self, gui, window_name, appmap, entry,
+                              remap=True):
+        """
+        Get accessible handle of the appmap entry
+
+        @param remap: Remap the window if the entry can't be resolved
+        @type remap: boolean
+
+        @return: accessible handle on success, else None
+        @rtype: object
+        """
+        return self._get_resolved_accessible(appmap, entry) or \
+            self._internal_get_object(gui, window_name, entry.key,
+                                      [entry.class_name], remap)
+
     def _get_object_in_window(self, appmap, obj_name, obj_type=[]):
         """
         Get object in appmap dict format, eg: {'class' : 'menu', 'key': 'mnu0'}
@@ -835,6 +1616,14 @@ class Utils:
         @return: object in appmap dict format
         @rtype: object
         """
+        if not obj_name:
+            return None
+        # Matched against every entry, compile once
+        obj_name = pattern_cache.locator(obj_name)
+        if not obj_name.glob:
+            # Without wildcards, the appmap indexes give the same
+            # result as matching every entry
+            return appmap.lookup(obj_name.name, obj_type)
         for name in appmap.keys():
             obj = appmap[name]
             if self._match_name_to_appmap(obj_name, obj, obj_type):
@@ -858,9 +1647,11 @@ class Utils:
         for i in range(retry):
             gui, name = self._internal_get_window_handle(window_name)
             if gui:
+                self._last_window = (window_name, gui)
                 return gui, name
             if wait:
                 time.sleep(1)
+        self._last_window = (window_name, None)
         return None, None
 
     def _internal_get_window_handle(self, window_name):
@@ -873,77 +1664,121 @@ class Utils:
         @return: window handle, window name in appmap format
         @rtype: object, string
         """
-        window_list = []
-        window_type = {}
-
-        for gui in self._list_guis():
-            if not gui:
-                continue
-            obj_name = self._ldtpize_accessible(gui)
-            if obj_name[1] == '':
-                # If label / label_by is empty string
-                # use index
-                if obj_name[0] in window_type:
-                    # If the same window type repeats
-                    # eg: multiple dialog window with empty title
-                    # then use, dlg0, dlg1, dlg2 etc
-                    window_type[obj_name[0]] += 1
-                else:
-                    # Initialize the first window in a type as 0
-                    # and increment this counter
-                    window_type[obj_name[0]] = 0
-                tmp_name = '%d' % window_type[obj_name[0]]
-            else:
-                # If window has title, use that
-                tmp_name = obj_name[1]
-            # Append window type and window title
-            try:
-                w_name = name = '%s%s' % (obj_name[0], tmp_name)
-            except UnicodeDecodeError:
-                w_name = name = '%s%s' % (obj_name[0], tmp_name.decode('utf-8'))
-            # If multiple window with same title, increment the index
-            index = 1
-            while name in window_list:
-                # If window name already exist in list, increase
-                # the index, so that we will have the window name
-                # always unique
-                name = '%s%d' % (w_name, index)
-                index += 1
-            window_list.append(name)
-
-            if self._match_name_to_acc(window_name, gui):
+        self._apply_window_events()
+        if self.window_registry.scanned:
+            gui, name = self._find_registered_window(window_name)
+            if gui:
                 return gui, name
+            if not self.app_table.resync_due():
+                # Window events keep the registry current, rescan at
+                # most once per resync interval in case some were missed
+                return None, None
+        # Not registered, rescan as window events might have been missed
+        self._rescan_windows()
+        return self._find_registered_window(window_name)
+
+    def _find_registered_window(self, window_name):
+        """
+        Find window in the window registry
 
-            # Search with LDTP appmap format
-            if window_name.find('#') != -1:
-                obj_index = '%s#%d' % (gui.getApplication().name,
-                                       gui.getIndexInParent())
-                if self._ldtp_debug:
-                    print('Window name has #', window_name, obj_index)
-                if self._ldtp_debug_file:
-                    with open(self._ldtp_debug_file, "a") as fp:
-                        fp.write('Window name has # %s %d', window_name, obj_index)
-                if window_name == obj_index:
-                    if self._ldtp_debug:
-                        print('Window found', gui, name)
-                    return gui, name
-            if window_name == name:
-                if self._ldtp_debug:
-                    print('Window found', gui, name)
-                return gui, name
-            if self._glob_match(window_name, name):
-                if self._ldtp_debug:
-                    print('Window found', gui, name)
-                return gui, name
-            if self._glob_match(re.sub(' ', '', window_name),
-                                re.sub(' ', '', name)):
+        @param window_name: window name, as provided by the caller
+        @type window_name: string
+
+        @return: window handle, window name in appmap format
+        @rtype: object, string
+        """
+        # Search with LDTP window name
+        record = self.window_registry.get(window_name)
+        if record and self._is_window_alive(record):
+            if self._ldtp_debug:
+                print('Window found', record.gui, record.name)
+            return record.gui, record.name
+        locator = pattern_cache.locator(window_name)
+        for record in self.window_registry.records():
+            if not self._match_name_to_window(locator, record):
+                continue
+            if self._is_window_alive(record):
                 if self._ldtp_debug:
-                    print('Window found', gui, name)
-                return gui, name
+                    print('Window found', record.gui, record.name)
+                return record.gui, record.name
         return None, None
 
+    def _is_window_alive(self, record):
+        """
+        Check the registered window still exist, else unregister it
+        """
+        try:
+            if not self._check_state(record.gui, pyatspi.STATE_DEFUNCT):
+                return True
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            # for the windows which no longer exist
+            pass
+        self.window_registry.remove(record.gui)
+        return False
+
+    def _match_name_to_window(self, window_name, record):
+        """
+        Match given name with the registered window, same as
+        _match_name_to_acc but with the names fetched on registration
+
+        @param window_name: window name, as provided by the caller
+        @type window_name: string
+        @param record: registered window
+        @type record: object
+
+        @return: Return 0 on failure, 1 on successful match
+        @rtype: integer
+        """
+        if not window_name:
+            return 0
+        locator = pattern_cache.locator(window_name)
+        window_name = locator.name
+        if record.title and locator.match(record.title):
+            return 1
+        # Concat object type and object name
+        # ex: 'frmUnsavedDocument1-gedit' for Gedit application
+        try:
+            _object_name = '%s%s' % (record.abbrev_role, record.label)
+        except UnicodeDecodeError:
+            _object_name = '%s%s' % (record.abbrev_role,
+                                     record.label.decode('utf-8'))
+        if locator.match(_object_name):
+            return 1
+        if record.is_window:
+            strip = WINDOW_STRIP
+        else:
+            strip = OBJECT_STRIP
+        # Strip given name too, as per window type or other type
+        _tmp_name = locator.stripped(strip)
+        if _tmp_name.match(_object_name):
+            return 1
+        if _tmp_name.match(record.label):
+            return 1
+        # Search with LDTP appmap format
+        if window_name.find('#') != -1:
+            try:
+                obj_index = '%s#%d' % (record.gui.getApplication().name,
+                                       record.gui.getIndexInParent())
+            except:
+                obj_index = None
+            if self._ldtp_debug:
+                print('Window name has #', window_name, obj_index)
+            if window_name == obj_index:
+                return 1
+        if window_name == record.name:
+            return 1
+        if locator.match(record.name):
+            return 1
+        if locator.stripped(SPACE_STRIP).match(
+                pattern_cache.strip(record.name, SPACE_STRIP)):
+            return 1
+        return 0
+
     def _get_object(self, window_name, obj_name, wait=True,
-                    obj_type = []):
+                    obj_type = [], remap = True):
+        if self.object_handles.is_handle(obj_name):
+            return self._get_handle_object(obj_name, wait, obj_type, remap)
         _window_handle, _window_name = \
             self._get_window_handle(window_name, wait)
         if not _window_handle:
@@ -955,7 +1790,7 @@ class Utils:
             retry=1
         for i in range(retry):
             obj = self._internal_get_object(_window_handle, _window_name,
-                                            obj_name, obj_type)
+                                            obj_name, obj_type, remap)
             if obj:
                 return obj
             if wait:
@@ -963,16 +1798,151 @@ class Utils:
         raise LdtpServerException(
             'Unable to find object name "%s" in application map' % obj_name)
 
+    def _resolve_handle(self, window_name, object_name):
+        """
+        Get the window and object names the handle was created for, so
+        that the methods working on names accept handles too. Names are
+        returned as is
+
+        @param window_name: Window name, as provided by the caller
+        @type window_name: string
+        @param object_name: Object name or handle, from getobjecthandle
+        @type object_name: string
+
+        @return: window name, object name
+        @rtype: tuple
+        """
+        if not self.object_handles.is_handle(object_name):
+            return window_name, object_name
+        record = self.object_handles.get(object_name)
+        if not record:
+            raise LdtpServerException('Unknown object handle "%s"' % \
+                                          object_name)
+        return record.window_name, record.object_name
+
+    def _get_object_entry(self, window_name, object_name):
+        """
+        Get the appmap entry of the object
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. Or handle, from
+        getobjecthandle
+        @type object_name: string
+
+        @return: appmap entry on success, else None
+        @rtype: object
+        """
+        handle = object_name
+        window_name, object_name = self._resolve_handle(window_name,
+                                                        object_name)
+        _window_handle, _window_name = \
+            self._get_window_handle(window_name, True)
+        if not _window_handle:
+            raise LdtpServerException('Unable to find window "%s"' % \
+                                          window_name)
+        if ';' in object_name:
+            # Handle of a menu item, mapped by its accessible
+            obj = self._get_menu_hierarchy(window_name, handle)
+            appmap = self._appmap_pairs(_window_handle, _window_name)
+            return appmap.get(appmap.name_of(obj))
+        appmap = self._appmap_pairs(_window_handle, _window_name)
+        return self._get_object_in_window(appmap, object_name)
+
+    def _get_handle_object(self, handle, wait=True, obj_type=[],
+                           remap=True):
+        """
+        Get the object of the given handle. The accessible resolved
+        earlier is used as long as it is the same object: not defunct,
+        with the same role and name, else the object is resolved again
+
+        @param handle: Object handle, from getobjecthandle
+        @type handle: string
+
+        @return: accessible handle
+        @rtype: object
+        """
+        record = self.object_handles.get(handle)
+        if not record:
+            raise LdtpServerException('Unknown object handle "%s"' % handle)
+        acc = record.acc
+        try:
+            if acc and not self._check_state(acc, pyatspi.STATE_DEFUNCT) and \
+                    acc.getRoleName() == record.role_name and \
+                    acc.name == record.name:
+                if obj_type and \
+                        record.role_name.replace(' ', '_') not in obj_type:
+                    # Not of the requested type, resolve as a name would
+                    return self._get_handle_names_object(record, wait,
+                                                         obj_type, remap)
+                self.object_handles.hits += 1
+                return acc
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            # for the objects which no longer exist
+            pass
+        # Stale, resolve again with the names the handle was created for
+        record.acc = None
+        acc = self._get_handle_names_object(record, wait, obj_type, remap)
+        record.acc = acc
+        record.role_name = acc.getRoleName()
+        record.name = acc.name
+        self.object_handles.reresolves += 1
+        return acc
+
+    def _get_handle_names_object(self, record, wait, obj_type, remap):
+        """
+        Resolve the names the handle was created for, the object name
+        or the menu hierarchy
+        """
+        if ';' in record.object_name:
+            return self._get_menu_hierarchy(record.window_name,
+                                            record.object_name, wait = wait,
+                                            remap = remap)
+        return self._get_object(record.window_name, record.object_name,
+                                wait, obj_type, remap)
+
     def _internal_get_object(self, window_handle, window_name,
-                             obj_name, obj_type):
-        appmap = self._appmap_pairs(window_handle, window_name)
+                             obj_name, obj_type, remap=True):
+        """
+        Get the accessible of the object, crawling the window if it isn't
+        mapped yet
+
+        @param remap: Remap the window if the object isn't in the cached
+        appmap or can't be resolved. Polls of the waits skip it, the
+        cached appmaps are patched from the children-changed events
+        @type remap: boolean
+
+        @return: accessible handle on success, else None
+        @rtype: object
+        """
+        appmap = self._cached_appmap(window_handle, window_name)
+        remapped = False
+        if appmap is None:
+            # A crawl resumed from an earlier lookup missed the objects
+            # added meanwhile to the parts crawled already
+            resumed = window_name in self._partial_crawls
+            # Not mapped yet / stale, crawl just until the object is found
+            _current_obj, appmap = self._lazy_get_object(
+                window_handle, window_name, obj_name, obj_type)
+            if _current_obj:
+                return _current_obj
+            remapped = not resumed
         obj = self._get_object_in_window(appmap, obj_name, obj_type)
-        if not obj:
+        if not obj and not remapped and remap:
             appmap = self._appmap_pairs(window_handle, window_name,
                                         force_remap = True)
             obj = self._get_object_in_window(appmap, obj_name, obj_type)
+            if obj:
+                # Cached appmap was stale
+                self._appmap.stale_recoveries += 1
         if not obj:
             return None
+        _current_obj = self._get_resolved_accessible(appmap, obj)
+        if _current_obj:
+            return _current_obj
         def _self_get_object(window, obj_name, obj):
             """
             window: Window handle in pyatspi format
@@ -1018,7 +1988,7 @@ class Utils:
                 if key in appmap and obj:
                     tmp_obj = obj.getChildAtIndex(_appmap_obj['child_index'])
                     if not tmp_obj:
-                        if obj.getRoleName() != _appmap_role:
+                        if property_memo.role_name(obj) != _appmap_role:
                             # Traversing object role and appmap role doesn't match
                             if self._ldtp_debug:
                                 print("Traversing object role and appmap role " \
@@ -1026,7 +1996,7 @@ class Utils:
                             return None
                         break
                     obj = tmp_obj
-                    if obj.getRoleName() != _appmap_role:
+                    if property_memo.role_name(obj) != _appmap_role:
                         # Traversing object role and appmap role doesn't match
                         if self._ldtp_debug:
                             print("Traversing object role and appmap role " \
@@ -1034,16 +2004,79 @@ class Utils:
                         return None
             return obj
         _current_obj = _self_get_object(window_name, obj_name, obj)
-        if not _current_obj:
+        if _current_obj and appmap.from_snapshot and \
+                not self._snapshot_entry_matches(_current_obj, obj):
+            # Window structure matched the snapshot, the object didn't
+            self.appmap_snapshots.stale += 1
+            _current_obj = None
+        if not _current_obj and remap:
             # retry once, before giving up
             appmap = self._appmap_pairs(window_handle, window_name,
                                         force_remap = True)
             obj = self._get_object_in_window(appmap, obj_name, obj_type)
             if not obj:
                 return None
+            _current_obj = self._get_resolved_accessible(appmap, obj)
+            if _current_obj:
+                return _current_obj
             _current_obj = _self_get_object(window_name, obj_name, obj)
+        if _current_obj:
+            # Next lookup of the same object skips the tree walk
+            appmap.bind(obj['key'], _current_obj)
         return _current_obj
 
+    def _snapshot_entry_matches(self, acc, entry):
+        """
+        Check whether the accessible resolved through the index path of
+        a snapshot entry has the name of the entry, the window
+        fingerprint doesn't cover the objects deep in the window
+
+        @param acc: Accessible handle
+        @type acc: object
+        @param entry: appmap entry
+        @type entry: object
+
+        @return: True if the name matches, else False
+        @rtype: bool
+        """
+        try:
+            return property_memo.name(acc) == entry['label']
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            return False
+
+    def _get_resolved_accessible(self, appmap, entry):
+        """
+        Get the accessible bound to the appmap entry, if it is still the
+        same object: not defunct, with the same role and name. Costs a
+        few round trips, compared to walking from the window to the object
+
+        @param appmap: application map of window
+        @type appmap: object
+        @param entry: appmap entry
+        @type entry: object
+
+        @return: accessible handle on success, else None
+        @rtype: object
+        """
+        acc = appmap.accessible(entry['key'])
+        if not acc:
+            Utils.handle_cache_stats['misses'] += 1
+            return None
+        try:
+            if not self._check_state(acc, pyatspi.STATE_DEFUNCT) and \
+                    acc.getRoleName().replace(' ', '_') == entry['class'] and \
+                    acc.name == entry['label']:
+                Utils.handle_cache_stats['hits'] += 1
+                return acc
+        except:
+            # In at-spi2 gi._glib.GError exception is thrown
+            # for the objects which no longer exist
+            pass
+        Utils.handle_cache_stats['stale'] += 1
+        appmap.unbind(entry['key'])
+        return None
+
     def _grab_focus(self, obj):
         try:
             componenti = obj.queryComponent()
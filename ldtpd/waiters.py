@@ -21,6 +21,8 @@ Headers in this file shall remain intact.
 
 wnckModule = False
 from utils import Utils
+from matcher import pattern_cache
+import os
 import re
 import time
 try:
@@ -44,130 +46,325 @@ import fnmatch
 import pyatspi
 import traceback
 import datetime
+from collections import OrderedDict
+from twisted.internet import defer
+
+# Pending conditions are polled this many milliseconds after the wait
+# started / a relevant event, the interval doubles after every poll up
+# to the waiter's timeout_seconds
+POLL_MIN_MS = int(os.environ.get('LDTP_WAIT_POLL_MS', 50))
+
+class _PendingWait(object):
+    __slots__ = ('waiter', 'deferred', 'deadline', 'next_poll',
+                 'interval', 'last_poll')
+
+    def __init__(self, waiter, now):
+        self.waiter = waiter
+        self.deferred = defer.Deferred()
+        self.deadline = now + waiter.timeout
+        self.interval = POLL_MIN_MS / 1000.0
+        self.next_poll = now + self.interval
+        self.last_poll = now
+
+class WaitEngine(object):
+    """
+    Waits pending in the daemon, driven by the daemon's main loop.
+
+    A wait is completed as soon as its condition is met, re-evaluated
+    on the AT-SPI events the waiter listens to and on a millisecond
+    timer backing off between polls, or when its deadline passes. The
+    RPC gets a Deferred, so the daemon serves other requests meanwhile
+    instead of spinning a nested main loop per wait
+    """
+    def __init__(self):
+        self._pending = []
+        # Event type -> waits listening to it
+        self._listeners = {}
+        self._timer = None
+        self._timer_due = None
+        self.stats = {'waits' : 0, 'succeeded' : 0, 'timeouts' : 0,
+                      'polls' : 0, 'event_wakeups' : 0}
+
+    def wait(self, waiter):
+        """
+        Wait for the waiter condition, till its timeout
+
+        @param waiter: Condition to wait for
+        @type waiter: object
+
+        @return: Deferred fired with True if the condition was met,
+        else False
+        @rtype: object
+        """
+        self.stats['waits'] += 1
+        waiter.success = False
+        # Single shot if there is no timeout
+        self._poll(waiter, not waiter.timeout)
+        if waiter.success or not waiter.timeout:
+            # Return the current state on success or timeout is 0
+            self._count(waiter)
+            return defer.succeed(waiter.success)
+        pending = _PendingWait(waiter, time.time())
+        self._pending.append(pending)
+        self._listen(waiter.events)
+        self._schedule()
+        return pending.deferred
+
+    def check(self, waiter):
+        """
+        Evaluate the waiter condition once, without waiting
+
+        @return: True if the condition is met, else False
+        @rtype: boolean
+        """
+        waiter.success = False
+        self._poll(waiter, True)
+        return waiter.success
+
+    def _poll(self, waiter, final=False):
+        self.stats['polls'] += 1
+        # The last poll of a wait looks harder, see Waiter.final
+        waiter.final = final
+        try:
+            waiter.poll()
+        except:
+            waiter._debug_traceback()
+        waiter.final = False
 
-_main_loop = None
-if not gtk3:
-   _gtk_vers = gtk.ver
-   if _gtk_vers[0] <= 2 and _gtk_vers[1] <= 15:
-       # Required for SLED11
-      _main_loop = gobject.MainLoop()
+    def _count(self, waiter):
+        if waiter.success:
+            self.stats['succeeded'] += 1
+        else:
+            self.stats['timeouts'] += 1
+
+    def _complete(self, pending):
+        if pending not in self._pending:
+            # Completed already, by an event dispatched meanwhile
+            return
+        self._pending.remove(pending)
+        self._unlisten(pending.waiter.events)
+        self._count(pending.waiter)
+        pending.deferred.callback(pending.waiter.success)
+
+    def _listen(self, events):
+        new_events = []
+        for event_type in events:
+            count = self._listeners.get(event_type, 0)
+            if not count:
+                new_events.append(event_type)
+            self._listeners[event_type] = count + 1
+        if new_events:
+            pyatspi.Registry.registerEventListener(self._event_cb,
+                                                   *new_events)
+
+    def _unlisten(self, events):
+        old_events = []
+        for event_type in events:
+            count = self._listeners[event_type] - 1
+            if count:
+                self._listeners[event_type] = count
+            else:
+                del self._listeners[event_type]
+                old_events.append(event_type)
+        if old_events:
+            pyatspi.Registry.deregisterEventListener(self._event_cb,
+                                                     *old_events)
+
+    def _schedule(self):
+        """
+        Run the timer for the earliest poll / deadline of the waits
+        """
+        if not self._pending:
+            if self._timer is not None:
+                gobject.source_remove(self._timer)
+                self._timer = None
+            return
+        due = min(min(pending.next_poll, pending.deadline) \
+                      for pending in self._pending)
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            gobject.source_remove(self._timer)
+        self._timer_due = due
+        self._timer = gobject.timeout_add(
+            max(0, int((due - time.time()) * 1000)), self._timer_cb)
+
+    def _timer_cb(self):
+        self._timer = None
+        now = time.time()
+        for pending in list(self._pending):
+            if pending.next_poll > now and pending.deadline > now:
+                continue
+            waiter = pending.waiter
+            self._poll(waiter, pending.deadline <= now)
+            if waiter.success or pending.deadline <= now:
+                self._complete(pending)
+                continue
+            pending.last_poll = now
+            pending.interval = min(pending.interval * 2,
+                                   waiter.timeout_seconds)
+            pending.next_poll = now + pending.interval
+        self._schedule()
+        # One shot, rescheduled for the next due wait
+        return False
 
-class Waiter(Utils):
+    def _event_cb(self, event):
+        try:
+            event_type = event.type
+        except:
+            return
+        repoll = False
+        for pending in list(self._pending):
+            waiter = pending.waiter
+            for listened in waiter.events:
+                if event_type.startswith(listened):
+                    break
+            else:
+                continue
+            try:
+                changed = waiter.event_cb(event)
+            except:
+                waiter._debug_traceback()
+                continue
+            if waiter.success:
+                self.stats['event_wakeups'] += 1
+                self._complete(pending)
+            elif changed:
+                # Something relevant changed, poll one back-off step
+                # earlier than the timer would. The back-off isn't reset,
+                # every poll failing doubles it, so that event bursts
+                # don't keep the daemon polling
+                pending.next_poll = min(pending.next_poll,
+                                        pending.last_poll + max(
+                        POLL_MIN_MS / 1000.0, pending.interval / 2))
+                repoll = True
+        if repoll:
+            self.stats['event_wakeups'] += 1
+            self._schedule()
+
+# Resolved objects are polled this often for the state waited for, in
+# case an object:state-changed event was missed
+STATE_POLL_SECONDS = 5
+
+# Shared by all the waits of the daemon
+wait_engine = WaitEngine()
+
+class Waiter(object):
+    """
+    Condition waited for, bound to the daemon instance: its appmaps,
+    window registry and state tables are shared, so that a waiter is
+    cheap to build and the lookups don't start from scratch
+    """
     events = []
-    def __init__(self, timeout):
-        Utils.__init__(self)
-        self.timer = None
+    def __init__(self, utils, timeout):
+        self._utils = utils
+        self._ldtp_debug = utils._ldtp_debug
+        self._ldtp_debug_file = utils._ldtp_debug_file
         self.timeout = timeout
+        # Longest interval between two polls, in seconds
         self.timeout_seconds = 1
+        self.success = False
+        # Set while the condition is evaluated for the last time: single
+        # shot checks and the poll at the deadline
+        self.final = False
+        # Application of the window waited in, once found
+        self._app = None
 
     def run(self):
-        self.success = False
-        self._timeout_count = 1
+        """
+        Wait through the wait engine
 
-        try:
-          self.poll()
-        except:
-          pass
+        @return: Deferred fired with the condition state
+        @rtype: object
+        """
+        return wait_engine.wait(self)
 
-        if self.success or self.timeout == 0:
-          # Return the current state on success
-          # or timeout is 0
-          return self.success
+    def check(self):
+        """
+        Evaluate the condition once
 
+        @return: True if the condition is met, else False
+        @rtype: boolean
+        """
+        return wait_engine.check(self)
+
+    def poll(self):
+        """
+        Evaluate the condition, set success if it is met
+        """
+        pass
+
+    def event_cb(self, event):
+        """
+        Handle an event of the listened types, set success if the
+        condition is met
+
+        @return: True if the condition has to be polled again
+        @rtype: boolean
+        """
+        return False
+
+    def _remap(self):
+        """
+        Check whether an object lookup missing in the cached appmap has
+        to remap the window. Cached appmaps are patched from the
+        children-changed events, so the polls in between skip it, the
+        last evaluation doesn't, in case some event was missed
+
+        @return: True if the window has to be remapped on a miss
+        @rtype: boolean
+        """
+        return self.final or not Utils.incremental_appmap
+
+    def _find_window_app(self, frame_name, obj_name=''):
+        """
+        Remember the application of the window, once found, so that the
+        events of the other applications can be ignored. Looked up on
+        events only, checks without waiting don't need it
+        """
+        if self._app is not None:
+            return
         try:
-          gobject.timeout_add_seconds(self.timeout_seconds,
-                                      self._timeout_cb)
-          if self.events:
-            pyatspi.Registry.registerEventListener(
-              self._event_cb, *self.events)
-          if _main_loop:
-            _main_loop.run()
-          else:
-            gtk.main()
-          if self.events:
-            pyatspi.Registry.deregisterEventListener(
-              self._event_cb, *self.events)
-        except:
-          if self._ldtp_debug:
-            print(traceback.format_exc())
-          if self._ldtp_debug_file:
-            with open(self._ldtp_debug_file, "a") as fp:
-              fp.write(traceback.format_exc())
-        return self.success
-
-    def _timeout_thread_cb(self, params):
-      # Thread callback takes params argument
-      # but gobject.timeout_add_seconds doesn't
-      self._timeout_cb()
-
-    def _timeout_cb(self):
-        if self.success: # dispose of previous waiters.
-            return False
-        self._timeout_count += 1
-        try:
-          self.poll()
+            # Handles are resolved in the window they were created for
+            frame_name, obj_name = self._utils._resolve_handle(frame_name,
+                                                               obj_name)
         except:
-          if self._ldtp_debug:
-            print(traceback.format_exc())
-          if self._ldtp_debug_file:
-            with open(self._ldtp_debug_file, "a") as fp:
-              fp.write(traceback.format_exc())
-        if self._timeout_count * self.timeout_seconds > self.timeout or \
-               self.success:
-            try:
-              # Required for wnck functions
-              if _main_loop:
-                _main_loop.quit()
-              else:
-                if gtk.main_level():
-                  gtk.main_quit()
-            except RuntimeError:
-              # In Mandriva RuntimeError exception is thrown
-              # If, gtk.main was already quit
-              pass
+            return
+        self._app = self._utils._window_app(frame_name)
+
+    def _from_window_app(self, event):
+        """
+        Check whether the event was sent by the application of the window
+
+        @return: False if the window wasn't found yet, or the event is
+        of some other application, else True
+        @rtype: boolean
+        """
+        if self._app is None:
+            # Window appearing is waited for with window:create
             return False
-        return True
-    
-    def poll(self):
-        pass
+        host_app = getattr(event, 'host_application', None)
+        return host_app is None or host_app == self._app
 
-    def _event_cb(self, event):
-      try:
-        self.event_cb(event)
-      except:
+    def _debug_traceback(self):
         if self._ldtp_debug:
           print(traceback.format_exc())
         if self._ldtp_debug_file:
           with open(self._ldtp_debug_file, "a") as fp:
             fp.write(traceback.format_exc())
-      if self.success:
-        try:
-          # Required for wnck functions
-          if _main_loop:
-            _main_loop.quit()
-          else:
-            if gtk.main_level():
-              gtk.main_quit()
-        except RuntimeError:
-          # In Mandriva RuntimeError exception is thrown
-          # If, gtk.main was already quit
-          pass
-
-    def event_cb(self, event):
-        pass
 
 class NullWaiter(Waiter):
-    def __init__(self, return_value, timeout):
+    def __init__(self, utils, return_value, timeout):
         self._return_value = return_value
-        Waiter.__init__(self, timeout)
+        Waiter.__init__(self, utils, timeout)
 
     def run(self):
-        Waiter.run(self)
-        return self._return_value
+        # Never met, fired with the return value on timeout
+        return Waiter.run(self).addCallback(lambda _: self._return_value)
 
 class MaximizeWindow(Waiter):
-    def __init__(self, frame_name):
-      Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+      Waiter.__init__(self, utils, 0)
       self._frame_name = frame_name
 
     def poll(self):
@@ -199,8 +396,8 @@ class MaximizeWindow(Waiter):
                 self.success = True
 
 class MinimizeWindow(Waiter):
-    def __init__(self, frame_name):
-        Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+        Waiter.__init__(self, utils, 0)
         self._frame_name = frame_name
 
     def poll(self):
@@ -232,8 +429,8 @@ class MinimizeWindow(Waiter):
                 self.success = True
 
 class UnmaximizeWindow(Waiter):
-    def __init__(self, frame_name):
-        Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+        Waiter.__init__(self, utils, 0)
         self._frame_name = frame_name
 
     def poll(self):
@@ -265,8 +462,8 @@ class UnmaximizeWindow(Waiter):
                 self.success = True
 
 class UnminimizeWindow(Waiter):
-    def __init__(self, frame_name):
-        Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+        Waiter.__init__(self, utils, 0)
         self._frame_name = frame_name
 
     def poll(self):
@@ -298,8 +495,8 @@ class UnminimizeWindow(Waiter):
                 self.success = True
 
 class ActivateWindow(Waiter):
-    def __init__(self, frame_name):
-        Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+        Waiter.__init__(self, utils, 0)
         self._frame_name = frame_name
 
     def poll(self):
@@ -329,8 +526,8 @@ class ActivateWindow(Waiter):
                 break
 
 class CloseWindow(Waiter):
-    def __init__(self, frame_name):
-        Waiter.__init__(self, 0)
+    def __init__(self, utils, frame_name):
+        Waiter.__init__(self, utils, 0)
         self._frame_name = frame_name
 
     def poll(self):
@@ -365,18 +562,21 @@ class CloseWindow(Waiter):
 
 class GuiExistsWaiter(Waiter):
     events = ["window:create"]
-    def __init__(self, frame_name, timeout):
-        Waiter.__init__(self, timeout)
+    def __init__(self, utils, frame_name, timeout):
+        Waiter.__init__(self, utils, timeout)
         self._frame_name = frame_name
+        # Matched against every window created, compile once
+        self._frame_locator = pattern_cache.locator(frame_name)
         self.top_level = None # Useful in subclasses
 
     def poll(self):
-        gui, _window_name = self._get_window_handle(self._frame_name)
+        gui, _window_name = \
+            self._utils._get_window_handle(self._frame_name)
         self.success = bool(gui)
 
     def event_cb(self, event):
       try:
-        if self._match_name_to_acc(self._frame_name, event.source):
+        if self._utils._match_name_to_acc(self._frame_locator, event.source):
             self.top_level = event.source
             self.success = True
       except:
@@ -388,18 +588,21 @@ class GuiExistsWaiter(Waiter):
 
 class GuiNotExistsWaiter(Waiter):
     events = ["window:destroy"]
-    def __init__(self, frame_name, timeout):
-        Waiter.__init__(self, timeout)
+    def __init__(self, utils, frame_name, timeout):
+        Waiter.__init__(self, utils, timeout)
         self.top_level = None
         self._frame_name = frame_name
+        # Matched against every window destroyed, compile once
+        self._frame_locator = pattern_cache.locator(frame_name)
 
     def poll(self):
-        gui, _window_name = self._get_window_handle(self._frame_name)
+        gui, _window_name = \
+            self._utils._get_window_handle(self._frame_name)
         self.success = not bool(gui)
 
     def event_cb(self, event):
       try:
-        if self._match_name_to_acc(self._frame_name, event.source):
+        if self._utils._match_name_to_acc(self._frame_locator, event.source):
             self.success = True
       except:
         if self._ldtp_debug:
@@ -409,29 +612,29 @@ class GuiNotExistsWaiter(Waiter):
             fp.write(traceback.format_exc())
 
 class ObjectExistsWaiter(GuiExistsWaiter):
-    def __init__(self, frame_name, obj_name, timeout, state = ''):
-      GuiExistsWaiter.__init__(self, frame_name, timeout)
+    if Utils.incremental_appmap:
+        # Cached appmaps are patched from children-changed events, so
+        # the object lookup is cheap enough to repeat on them
+        events = ["window:create", "object:children-changed"]
+    def __init__(self, utils, frame_name, obj_name, timeout):
+      GuiExistsWaiter.__init__(self, utils, frame_name, timeout)
       self.timeout_seconds = 2
       self._obj_name = obj_name
-      self._state = state
+
+    def _resolve(self):
+        remap = self._remap()
+        if self._obj_name and re.search(';', self._obj_name):
+            return self._utils._get_menu_hierarchy(self._frame_name,
+                                                   self._obj_name,
+                                                   wait = False,
+                                                   remap = remap)
+        return self._utils._get_object(self._frame_name, self._obj_name,
+                                       False, remap = remap)
 
     def poll(self):
         try:
-          if self._obj_name and re.search(';', self._obj_name):
-            obj = self._get_menu_hierarchy(self._frame_name, self._obj_name)
-          else:
-            obj = self._get_object(self._frame_name, self._obj_name, False)
-          if self._state:
-            _state_inst = obj.getState()
-            _obj_state = _state_inst.getStates()
-            state = 'STATE_%s' % self._state.upper()
-            if (state in self._states and \
-                  self._states[state] in _obj_state) or \
-                  (state in self._states_old and \
-                     self._states_old[state] in _obj_state):
-              self.success = True
-          else:
-            self.success = True
+          self._resolve()
+          self.success = True
         except:
             if self._ldtp_debug_file:
                 with open(self._ldtp_debug_file, "a") as fp:
@@ -440,25 +643,318 @@ class ObjectExistsWaiter(GuiExistsWaiter):
               print(traceback.format_exc())
 
     def event_cb(self, event):
+      if event.type.startswith('object:children-changed'):
+        # Objects got added, poll again if in the window's application
+        self._find_window_app(self._frame_name, self._obj_name)
+        return self._from_window_app(event)
       GuiExistsWaiter.event_cb(self, event)
-      self.success = False
+      if self.success:
+        # Window appeared, poll for the object in it
+        self.success = False
+        return True
+      return False
+
+class StateWaiter(ObjectExistsWaiter):
+    """
+    Object state waited for. The object is resolved once, from then on
+    the object:state-changed:<state> events of the accessible complete
+    the wait, the state is polled just as a safety net
+    """
+    def __init__(self, utils, frame_name, obj_name, timeout, state):
+        ObjectExistsWaiter.__init__(self, utils, frame_name, obj_name,
+                                    timeout)
+        self._state = state
+        # Event details are hyphenated, eg: multi-line
+        self._state_event = 'object:state-changed:%s' % \
+            state.lower().replace('_', '-')
+        self.events = list(self.events) + [self._state_event]
+        self._acc = None
+
+    def _has_state(self, obj):
+        _obj_state = obj.getState().getStates()
+        state = 'STATE_%s' % self._state.upper()
+        return (state in self._utils._states and \
+                    self._utils._states[state] in _obj_state) or \
+                    (state in self._utils._states_old and \
+                         self._utils._states_old[state] in _obj_state)
+
+    def poll(self):
+        if self._acc is not None:
+            try:
+                if self._utils._check_state(self._acc,
+                                            pyatspi.STATE_DEFUNCT):
+                    self._acc = None
+            except:
+                self._acc = None
+        if self._acc is None:
+            # Looked up every 2 seconds at most, till found
+            self.timeout_seconds = 2
+            self._acc = self._resolve()
+            self.timeout_seconds = STATE_POLL_SECONDS
+        self.success = self._has_state(self._acc)
+
+    def event_cb(self, event):
+        if not event.type.startswith(self._state_event):
+            if self._acc is None:
+                # Not resolved yet, the object might have appeared
+                return ObjectExistsWaiter.event_cb(self, event)
+            return False
+        if self._acc is not None and event.detail1 and \
+                event.source == self._acc:
+            self.success = True
+        return False
 
 class ObjectNotExistsWaiter(GuiNotExistsWaiter):
-    def __init__(self, frame_name, obj_name, timeout):
-        GuiNotExistsWaiter.__init__(self, frame_name, timeout)
+    if Utils.incremental_appmap:
+        events = ["window:destroy", "object:children-changed"]
+    def __init__(self, utils, frame_name, obj_name, timeout):
+        GuiNotExistsWaiter.__init__(self, utils, frame_name, timeout)
         self.timeout_seconds = 2
         self._obj_name = obj_name
 
     def poll(self):
+        remap = self._remap()
         try:
             if re.search(';', self._obj_name):
-                self._get_menu_hierarchy(self._frame_name, self._obj_name)
+                self._utils._get_menu_hierarchy(self._frame_name,
+                                                self._obj_name,
+                                                wait = False,
+                                                remap = remap)
             else:
-                self._get_object(self._frame_name, self._obj_name, False)
+                self._utils._get_object(self._frame_name, self._obj_name,
+                                        False, remap = remap)
             self.success = False
         except:
             self.success = True
 
+    def event_cb(self, event):
+        if event.type.startswith('object:children-changed'):
+            # Objects got removed, poll again if in the window's
+            # application
+            self._find_window_app(self._frame_name, self._obj_name)
+            return self._from_window_app(event)
+        GuiNotExistsWaiter.event_cb(self, event)
+        return False
+
+class MultiWaiter(Waiter):
+    """
+    Any / all of the given conditions, evaluated by one wait. A condition
+    counts as met once it was met during the wait
+    """
+    def __init__(self, utils, waiters, timeout, wait_all=False):
+        Waiter.__init__(self, utils, timeout)
+        self._waiters = waiters
+        self._wait_all = wait_all
+        # Events of all the conditions
+        self.events = sorted(set([event_type for waiter in waiters \
+                                      for event_type in waiter.events]))
+        self.timeout_seconds = min([waiter.timeout_seconds \
+                                        for waiter in waiters])
+        # Condition index -> seconds since the wait started, in the
+        # order the conditions were met
+        self.met = OrderedDict()
+        self._start = time.time()
+
+    def run(self):
+        """
+        Wait through the wait engine
+
+        @return: Deferred fired with the wait result, see _result
+        @rtype: object
+        """
+        self._start = time.time()
+        return Waiter.run(self).addCallback(self._result)
+
+    def _set_met(self, index):
+        self.met[index] = time.time() - self._start
+        if self._wait_all:
+            self.success = len(self.met) == len(self._waiters)
+        else:
+            self.success = True
+
+    def poll(self):
+        for index, waiter in enumerate(self._waiters):
+            if index in self.met:
+                continue
+            waiter.success = False
+            waiter.final = self.final
+            try:
+                waiter.poll()
+            except:
+                waiter._debug_traceback()
+                continue
+            finally:
+                waiter.final = False
+            if waiter.success:
+                self._set_met(index)
+                if self.success:
+                    break
+
+    def event_cb(self, event):
+        repoll = False
+        for index, waiter in enumerate(self._waiters):
+            if index in self.met:
+                continue
+            for listened in waiter.events:
+                if event.type.startswith(listened):
+                    break
+            else:
+                continue
+            waiter.success = False
+            try:
+                if waiter.event_cb(event):
+                    repoll = True
+            except:
+                waiter._debug_traceback()
+                continue
+            if waiter.success:
+                self._set_met(index)
+                if self.success:
+                    break
+        return repoll
+
+    def _result(self, success):
+        """
+        Describe the outcome of the wait
+
+        @return: result 1 if the wait succeeded else 0, condition index
+        which completed the wait (-1 on timeout), seconds waited and
+        the [condition index, seconds] of the conditions met
+        @rtype: dict
+        """
+        met = [[index, elapsed] for index, elapsed in self.met.items()]
+        if success:
+            condition = met[-1][0]
+        else:
+            condition = -1
+        return {'result' : int(success),
+                'condition' : condition,
+                'elapsed' : time.time() - self._start,
+                'met' : met}
+
+class SettleStats(object):
+    """
+    Settle times measured by the idle waits, per application: seconds
+    from the start of the wait to the last event of the application
+    """
+    def __init__(self):
+        self._apps = {}
+
+    def add(self, app_name, settle, idle):
+        stats = self._apps.get(app_name)
+        if stats is None:
+            stats = self._apps[app_name] = {'count' : 0, 'total' : 0.0,
+                                            'max' : 0.0, 'last' : 0.0,
+                                            'timeouts' : 0}
+        stats['count'] += 1
+        stats['total'] += settle
+        stats['max'] = max(stats['max'], settle)
+        stats['last'] = settle
+        if not idle:
+            stats['timeouts'] += 1
+
+    def stats(self):
+        """
+        Get settle times
+
+        @return: application name (empty for all the applications) ->
+        count, mean, max and last settle time in seconds, and the waits
+        which timed out before the application got idle
+        @rtype: dict
+        """
+        result = {}
+        for app_name, stats in self._apps.items():
+            result[app_name] = {'count' : stats['count'],
+                                'mean' : stats['total'] / stats['count'],
+                                'max' : stats['max'],
+                                'last' : stats['last'],
+                                'timeouts' : stats['timeouts']}
+        return result
+
+# Shared by all the idle waits of the daemon
+settle_stats = SettleStats()
+
+class IdleWaiter(Waiter):
+    """
+    Application idle waited for: no AT-SPI event from the application
+    of the window for the quiet interval. Any application counts if
+    no window is given / found. Window, children and name events are
+    tracked by the daemon all along, every object event is listened
+    to only while waiting
+    """
+    events = ["object", "window"]
+    def __init__(self, utils, frame_name, quiet_ms, timeout):
+        Waiter.__init__(self, utils, timeout)
+        self._frame_name = frame_name
+        self._quiet = quiet_ms / 1000.0
+        # Polled a few times per quiet interval
+        self.timeout_seconds = max(POLL_MIN_MS / 1000.0, self._quiet / 4)
+        self._app = None
+        self._app_name = ''
+        self._last_event = None
+        self._start = time.time()
+
+    def _find_app(self):
+        if not self._frame_name:
+            return
+        try:
+            gui, _window_name = \
+                self._utils._get_window_handle(self._frame_name)
+            if gui:
+                self._app = gui.getApplication()
+                self._app_name = self._app.name
+        except:
+            self._debug_traceback()
+            self._app = None
+
+    def run(self):
+        """
+        Wait through the wait engine
+
+        @return: Deferred fired with 1 if the application got idle
+        before the timeout, else 0
+        @rtype: object
+        """
+        self._start = time.time()
+        self._find_app()
+        if self._app is not None:
+            record = self._utils.app_table.get(self._app)
+            if record:
+                self._last_event = record.last_event
+        else:
+            last_events = [record.last_event for record in \
+                               self._utils.app_table.records() \
+                               if record.last_event]
+            if last_events:
+                self._last_event = max(last_events)
+        return Waiter.run(self).addCallback(self._settled)
+
+    def poll(self):
+        last_event = self._last_event
+        if last_event is None:
+            # No event seen yet, the application might have just started
+            # and not sent any, idle once quiet since the wait started
+            last_event = self._start
+        self.success = time.time() - last_event >= self._quiet
+
+    def event_cb(self, event):
+        host_app = getattr(event, 'host_application', None)
+        if self._app is None or host_app is None or host_app == self._app:
+            self._last_event = time.time()
+        return False
+
+    def _settled(self, idle):
+        if self._last_event and self._last_event > self._start:
+            settle = self._last_event - self._start
+        else:
+            settle = 0.0
+        settle_stats.add(self._app_name, settle, idle)
+        if self._ldtp_debug:
+            print('%s settled in %.3f seconds' % \
+                      (self._app_name or 'desktop', settle))
+        return int(idle)
+
 if __name__ == "__main__":
-    waiter = ObjectExistsWaiter('frmCalculator', 'mnuEitanIsaacsonFoo', 0)
-    print(waiter.run())
+    waiter = ObjectExistsWaiter(Utils(), 'frmCalculator',
+                                'mnuEitanIsaacsonFoo', 0)
+    print(waiter.check())
@@ -21,18 +21,23 @@ Headers in this file shall remain intact.
 
 import os
 import re
-import time
 import core
 from core import Ldtpd
 from twisted.web import xmlrpc
 import xmlrpclib
 from log import logger
+from memo import property_memo
+from waiters import IdleWaiter
 
 if 'LDTP_COMMAND_DELAY' in os.environ:
     delay = os.environ['LDTP_COMMAND_DELAY']
 else:
     delay = None
 
+# Adaptive pacing, commands are delayed till the application is quiet
+# for these many milliseconds, see pacecmdexec
+pacing = os.environ.get('LDTP_ADAPTIVE_PACING', None)
+
 _ldtp_debug = os.environ.get('LDTP_DEBUG', None)
 _ldtp_debug_file = os.environ.get('LDTP_DEBUG_FILE', None)
 
@@ -71,9 +76,63 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
 
             return xmlrpclib.Fault(self.FAILURE, value)
 
+    def _serve(self, function, functionPath, args, kwargs):
+        """
+        Call the function, memoizing the accessible properties it
+        fetches till it returns. Deferreds it returns fire later,
+        without the memo
+        """
+        property_memo.begin_request()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            fetched, saved = property_memo.end_request()
+            if _ldtp_debug:
+                debug_st = '%s: %d properties fetched, %d memoized' % \
+                    (functionPath, fetched, saved)
+                print(debug_st)
+                logger.debug(debug_st)
+
+    def _pace_command(self, args, pace):
+        """
+        Delay the command for the fixed command delay, or with adaptive
+        pacing, till the application of the command window is idle
+
+        @param args: Command arguments, the window name first
+        @type args: tuple
+        @param pace: Command delay in seconds, longest wait with
+        adaptive pacing
+        @type pace: float
+
+        @return: Deferred fired when the command can be executed
+        @rtype: object
+        """
+        quiet_ms = self._pacecmdexec or pacing
+        if not quiet_ms:
+            return self.wait(pace)
+        try:
+            quiet_ms = float(quiet_ms)
+        except ValueError:
+            return self.wait(pace)
+        window_name = None
+        if args and self.window_registry.scanned:
+            # Commands take the window name first, the application is
+            # watched only if it names a registered window, the windows
+            # aren't rescanned for the commands taking other arguments
+            try:
+                self._apply_window_events()
+                gui, window_name = self._find_registered_window(args[0])
+            except:
+                # Not a window name
+                window_name = None
+        if not window_name:
+            return self.wait(pace)
+        return IdleWaiter(self, window_name, quiet_ms, pace).run()
+
     def render_POST(self, request):
         request.content.seek(0, 0)
         request.setHeader("content-type", "text/xml")
+        pace = 0
         try:
             args, functionPath = xmlrpclib.loads(request.content.read())
             if args and isinstance(args[-1], dict):
@@ -81,20 +140,24 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
                 # fail, so using self, kind of work around !
                 kwargs = args[-1]
                 args = args[:-1]
-                if delay or self._delaycmdexec:
+                if delay or self._delaycmdexec or \
+                        self._pacecmdexec or pacing:
                     pattern = '(wait|exist|has|get|verify|enabled|'
                     pattern += 'launch|image|system)'
                     p = re.compile(pattern)
                     if not p.search(functionPath):
-                        # Sleep for 1 second, else the at-spi-registryd dies,
-                        # on the speed we execute
+                        # Delay the command, else the at-spi-registryd
+                        # dies, on the speed we execute
                         try:
                             if self._delaycmdexec:
-                                self.wait(float(self._delaycmdexec))
+                                pace = float(self._delaycmdexec)
+                            elif delay:
+                                pace = float(delay)
                             else:
-                                self.wait(float(delay))
+                                # Adaptive pacing alone, longest wait
+                                pace = 1.0
                         except ValueError:
-                            time.sleep(0.5)
+                            pace = 0.5
             else:
                 kwargs = {}
         except Exception as e:
@@ -122,9 +185,16 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
                 if _ldtp_debug_file:
                     with open(_ldtp_debug_file, "a") as fp:
                         fp.write(debug_st)
-                xmlrpc.defer.maybeDeferred(function, *args,
-                                           **kwargs).\
-                                           addErrback(self._ebRender).\
-                                           addCallback(self._cbRender,
-                                                       request)
+                if pace:
+                    # Waited on the daemon loop, other requests are
+                    # served meanwhile
+                    d = self._pace_command(args, pace).addCallback(
+                        lambda _: self._serve(function, functionPath,
+                                              args, kwargs))
+                else:
+                    d = xmlrpc.defer.maybeDeferred(self._serve, function,
+                                                   functionPath, args,
+                                                   kwargs)
+                d.addErrback(self._ebRender).\
+                    addCallback(self._cbRender, request)
         return xmlrpc.server.NOT_DONE_YET
@@ -0,0 +1,142 @@
+"""
+Object handles passed in place of the object name, to the menu methods
+and to getobjectinfo / getobjectproperty, on a synthetic window.
+
+Usage: python tests/test_object_handles.py
+
+@author: Nagappan Alagappan <nagappan@gmail.com>
+@copyright: Copyright (c) 2009-14 Nagappan Alagappan
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import sys
+import unittest
+
+# Synthetic accessibles of the benchmarks, which put ldtpd on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'benchmarks'))
+
+import pyatspi
+from synthetic import Accessible, round_trips
+from appmap import AppmapStore
+from registry import AppTable, HandleTable, WindowRegistry
+from server_exception import LdtpServerException
+from collections import OrderedDict
+import core
+
+def build_editor():
+    """
+    Application with a frame holding a File menu and a Save button
+    """
+    quit_item = Accessible('Quit', pyatspi.ROLE_MENU_ITEM, 'menu item')
+    wrap_item = Accessible('Wrap', pyatspi.ROLE_CHECK_MENU_ITEM,
+                           'check menu item')
+    wrap_item.states.append(pyatspi.STATE_CHECKED)
+    file_menu = Accessible('File', pyatspi.ROLE_MENU, 'menu',
+                           [quit_item, wrap_item])
+    menu_bar = Accessible('', pyatspi.ROLE_MENU_BAR, 'menu bar', [file_menu])
+    save = Accessible('Save', pyatspi.ROLE_PUSH_BUTTON, 'push button',
+                      description='Save the document')
+    frame = Accessible('Editor', pyatspi.ROLE_FRAME, 'frame',
+                       [menu_bar, save])
+    return Accessible('editor', pyatspi.ROLE_APPLICATION, 'application',
+                      [frame])
+
+class SyntheticLdtpd(core.Ldtpd):
+    """
+    Ldtpd on the synthetic application, without a desktop connection
+    """
+    def __init__(self, app):
+        self._appmap = AppmapStore()
+        self._appmap_changes = OrderedDict()
+        self._partial_crawls = {}
+        self._window_events = OrderedDict()
+        self._window_event_timer = None
+        self._desktop = [app]
+        self.app_table = AppTable()
+        self.app_table.add(app)
+        self._handle_table_cell = False
+        self._obj_timeout = 1
+        self._gui_timeout = 1
+        self._process_stats = {}
+        self._ldtp_debug = None
+        self._ldtp_debug_file = None
+        self._states = {}
+        self._states_old = {}
+        self._state_names = {}
+        self._old_state_names = {}
+        self._get_all_state_names()
+
+class ObjectHandleTest(unittest.TestCase):
+    def setUp(self):
+        core.Utils.window_registry = WindowRegistry()
+        # Handles of the editors of earlier tests
+        core.Utils.object_handles = HandleTable()
+        self.ldtpd = SyntheticLdtpd(build_editor())
+
+    def test_menu_hierarchy_handle(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'mnuFile;mnuQuit')
+        self.assertEqual(self.ldtpd.doesmenuitemexist('frmEditor', handle,
+                                                      True), 1)
+        self.assertEqual(self.ldtpd.menuitemenabled('frmEditor', handle), 1)
+
+    def test_menu_hierarchy_handle_resolved_once(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'mnuFile;mnuQuit')
+        reresolves = self.ldtpd.object_handles.reresolves
+        round_trips.reset()
+        acc = self.ldtpd._get_menu_hierarchy('frmEditor', handle)
+        handle_trips = round_trips.count
+        self.assertTrue(acc is self.ldtpd.object_handles.get(handle).acc)
+        # The hierarchy isn't walked again
+        round_trips.reset()
+        self.ldtpd._get_menu_hierarchy('frmEditor', 'mnuFile;mnuQuit')
+        self.assertTrue(handle_trips < round_trips.count)
+        # Not of the requested type, walked again through the hierarchy
+        self.assertEqual(self.ldtpd._get_object('frmEditor', handle, False,
+                                                ['push_button']), acc)
+        self.assertEqual(self.ldtpd.object_handles.reresolves, reresolves)
+
+    def test_menu_item_handle(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'mnuWrap')
+        self.assertEqual(self.ldtpd.verifymenucheck('frmEditor', handle), 1)
+        self.assertEqual(self.ldtpd.verifymenuuncheck('frmEditor', handle),
+                         0)
+        # Hierarchy lookup resolves the handle before prefixing 'mnu'
+        self.assertEqual(self.ldtpd._get_menu_hierarchy('frmEditor', handle),
+                         self.ldtpd._get_object('frmEditor', 'mnuWrap'))
+
+    def test_getobjectinfo_handle(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'btnSave')
+        self.assertEqual(self.ldtpd.getobjectinfo('frmEditor', handle),
+                         self.ldtpd.getobjectinfo('frmEditor', 'btnSave'))
+        self.assertEqual(self.ldtpd.getobjectproperty('frmEditor', handle,
+                                                      'description'),
+                         'Save the document')
+
+    def test_getobjectinfo_menu_handle(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'mnuFile;mnuQuit')
+        self.assertEqual(self.ldtpd.getobjectproperty('frmEditor', handle,
+                                                      'key'), 'mnuQuit')
+
+    def test_unknown_handle(self):
+        handle = self.ldtpd.getobjecthandle('frmEditor', 'btnSave')
+        self.ldtpd.releaseobjecthandle(handle)
+        self.assertRaises(LdtpServerException, self.ldtpd.getobjectinfo,
+                          'frmEditor', handle)
+        self.assertEqual(self.ldtpd.doesmenuitemexist('frmEditor', handle,
+                                                      True), 0)
+
+if __name__ == '__main__':
+    unittest.main()